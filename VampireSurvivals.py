@@ -1,9 +1,29 @@
+import time
+STARTUP_TIME = time.perf_counter()  # 첫 프레임까지 걸린 시간의 기준점. pygame/numpy 등 무거운 import보다 먼저 잰다
 import pygame
 import random
 import math
 import json
 import os
 import sys
+import argparse
+import heapq
+import csv
+import contextlib
+import io
+import mmap
+import struct
+import gzip
+import bisect
+import threading
+import warnings
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import OrderedDict, deque
+try:
+    import numpy as np
+except ImportError:  # numpy 없이도 게임은 돌아가며, 벡터화 적 엔진만 쓸 수 없다
+    np = None
 
 # --- 리소스 경로 함수 ---
 def resource_path(relative_path):
@@ -14,15 +34,113 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# --- 에셋 번들 ---
+ASSET_BUNDLE_FILE, ASSET_BUNDLE_MAGIC, ASSET_BUNDLE_VERSION = 'assets.pak', b'VSPK', 1
+ASSET_BUNDLE_HEADER = struct.Struct('<4sII')  # 매직, 버전, JSON 인덱스 바이트 수
+
+class BufferReader(io.RawIOBase):
+    """ 메모리 버퍼 위의 읽기 전용 파일 객체. mmap 구간을 복사 없이 pygame에 파일처럼 넘길 때 쓴다 """
+    def __init__(self, buffer): super().__init__(); self.buffer, self.position = memoryview(buffer), 0
+    def readable(self): return True
+    def seekable(self): return True
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self.buffer) - self.position))
+        b[:n] = self.buffer[self.position:self.position + n]; self.position += n
+        return n
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.buffer)}[whence]
+        self.position = max(0, base + offset); return self.position
+    def tell(self): return self.position
+
+class AssetBundle:
+    """ 리소스 여러 개를 [헤더][JSON 인덱스][데이터...]로 이어 붙인 파일. mmap으로 열어 항목을 복사 없이 memoryview로 내준다.
+    인덱스 항목은 {'offset': 데이터 구역 기준 위치, 'size': 바이트 수}이고, 미리 구운 서피스는 'surface': [w, h, 픽셀 형식]을 더 가진다 """
+    def __init__(self, path):
+        """ 헤더/인덱스가 깨졌거나 파일이 잘려 항목이 끝을 넘으면 ValueError """
+        with open(path, 'rb') as f: self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # 빈 파일도 ValueError
+        try:
+            if len(self.map) < ASSET_BUNDLE_HEADER.size: raise ValueError(f"{path}: 에셋 번들 헤더가 잘렸습니다")
+            magic, version, index_size = ASSET_BUNDLE_HEADER.unpack_from(self.map)
+            if magic != ASSET_BUNDLE_MAGIC or version != ASSET_BUNDLE_VERSION: raise ValueError(f"{path}: 지원하지 않는 에셋 번들입니다")
+            self.data_start = ASSET_BUNDLE_HEADER.size + index_size
+            if self.data_start > len(self.map): raise ValueError(f"{path}: 에셋 번들 인덱스가 잘렸습니다")
+            self.index = json.loads(self.map[ASSET_BUNDLE_HEADER.size:self.data_start])
+            if any(self.data_start + e['offset'] + e['size'] > len(self.map) for e in self.index.values()):
+                raise ValueError(f"{path}: 에셋 번들 데이터가 잘렸습니다")
+        except ValueError: self.map.close(); raise
+        except (KeyError, TypeError, AttributeError) as e:
+            self.map.close(); raise ValueError(f"{path}: 에셋 번들 인덱스가 잘못됐습니다 ({e!r})") from e
+    def __contains__(self, name): return name in self.index
+    def view(self, name):
+        entry = self.index[name]; start = self.data_start + entry['offset']
+        return memoryview(self.map)[start:start + entry['size']]
+    def surface_format(self, name): return self.index[name].get('surface') if name in self.index else None
+    @staticmethod
+    def write(path, entries):
+        """ entries: {이름: (바이트, 추가 인덱스 정보)}를 번들 파일로 쓴다 """
+        index, offset = {}, 0
+        for name, (data, meta) in entries.items(): index[name] = dict(meta, offset=offset, size=len(data)); offset += len(data)
+        index_bytes = json.dumps(index, ensure_ascii=False).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(ASSET_BUNDLE_HEADER.pack(ASSET_BUNDLE_MAGIC, ASSET_BUNDLE_VERSION, len(index_bytes))); f.write(index_bytes)
+            for data, _ in entries.values(): f.write(data)
+
+class ResourceLoader:
+    """ 리소스를 에셋 번들에서 먼저 찾고 없으면 resource_path의 낱개 파일을 쓴다. 번들은 처음 필요할 때 한 번 연다.
+    exe로 묶었을 때는 exe 옆의 번들을 먼저 본다: exe 안(_MEIPASS)에 넣으면 실행할 때마다 임시 폴더로 풀리기 때문이다 """
+    def __init__(self, bundle_file): self.bundle_file, self.bundle, self.checked = bundle_file, None, False
+    def bundle_paths(self):
+        if getattr(sys, 'frozen', False): yield os.path.join(os.path.dirname(sys.executable), self.bundle_file)
+        yield resource_path(self.bundle_file)
+    def get_bundle(self):
+        if not self.checked:
+            self.checked = True
+            for path in self.bundle_paths():
+                if not os.path.exists(path): continue
+                try: self.bundle = AssetBundle(path); break
+                except (OSError, ValueError) as e: print(f"asset bundle ignored ({e}), using loose files")
+        return self.bundle
+    def view(self, relative_path):
+        """ 리소스 내용 버퍼. 번들에 있으면 mmap 구간 그대로, 없으면 파일을 읽은 것 """
+        key, bundle = relative_path.replace(os.sep, '/'), self.get_bundle()
+        if bundle and key in bundle: return bundle.view(key)
+        with open(resource_path(relative_path), 'rb') as f: return memoryview(f.read())
+    def open(self, relative_path):
+        """ 리소스를 읽기용 파일 객체로 연다 """
+        key, bundle = relative_path.replace(os.sep, '/'), self.get_bundle()
+        return BufferReader(bundle.view(key)) if bundle and key in bundle else open(resource_path(relative_path), 'rb')
+    def surface(self, name):
+        """ 번들에 미리 구워 둔 서피스(픽셀은 mmap을 그대로 가리킨다). 없으면 None """
+        bundle = self.get_bundle()
+        if not bundle or not (fmt := bundle.surface_format(name)): return None
+        width, height, pixel_format = fmt
+        return pygame.image.frombuffer(bundle.view(name), (width, height), pixel_format)
+
+RESOURCES = ResourceLoader(ASSET_BUNDLE_FILE)
+
 # --- 상수 정의 ---
 SCREEN_WIDTH, SCREEN_HEIGHT = 1024, 768
 WORLD_WIDTH, WORLD_HEIGHT = SCREEN_WIDTH * 5, SCREEN_HEIGHT * 5
 FPS, MAX_ENEMIES_ON_SCREEN = 60, 150
+# 속도/회전 수치는 FPS(60Hz) 한 틱 기준이다. 고정 틱 루프가 한 프레임에 따라잡을 최대 시간(ms)
+MAX_FRAME_TIME = 250
+ENEMY_SEPARATION_RADIUS = 40
+SHARD_MIN_ENEMIES = 1500  # 조향할 적이 이보다 적으면 프로세스 왕복 비용이 더 커서 ShardedHorde도 메인 프로세스에서 바로 계산
+# LOD: 플레이어에게서 LOD_DISTANCE 넘게 떨어지고 화면(+여백) 밖인 적은 LOD_BUCKETS 틱에 한 번만, 분리 없이 움직인다
+LOD_DISTANCE, LOD_BUCKETS, LOD_VIEW_MARGIN = 800, 4, 100
+# 플로우 필드 셀 크기 (장애물이 있을 때만 적이 필드를 따라간다)
+FLOW_CELL_SIZE = 64
+FLOW_INTEGRATE_BUDGET = 1200  # 장애물 필드를 다시 계산할 때 한 틱에 확정하는 셀 수 (한 번에 몰아서 하면 프레임이 끊긴다)
+# 경험치 젬: 이 거리 안에 떨어지면 기존 젬에 합치고, 개수가 상한을 넘으면 가장 가까운 젬에 합친다
+GEM_MERGE_RADIUS, MAX_EXP_GEMS, LARGE_GEM_VALUE = 30, 300, 100
+GEM_MAGNET_RADIUS, GEM_MAGNET_SPEED, GEM_PICKUP_RADIUS = 100, 10, 25
 SAVE_FILE = 'save_data.json'
+SAVE_COALESCE_DELAY = 0.2  # 저장 요청 뒤 이만큼(초) 더 기다려 연달아 들어온 요청을 한 번의 쓰기로 합친다
 
 # --- 색상 정의 ---
 BLACK, WHITE, BLUE, RED, GREEN = (0,0,0), (255,255,255), (0,0,255), (255,0,0), (0,255,0)
 YELLOW, CYAN, DARK_GREY, LIGHT_GREY = (255,255,20), (0,255,255), (40,40,40), (100,100,100)
+ORANGE = (255,140,0)
 UI_BG_COLOR, UI_BORDER_COLOR, UI_OPTION_BG_COLOR = (50,50,80), (200,200,255), (80,80,120)
 
 # --- 데이터 정의 ---
@@ -43,7 +161,74 @@ PERMANENT_UPGRADE_DATA = {
     'EXP_GAIN': {'name': '경험치 획득량 증가', 'base_cost': 150, 'cost_increase_factor': 1.8, 'max_level': 10},
     'GOLD_GAIN':{'name': '골드 획득량 증가', 'base_cost': 150, 'cost_increase_factor': 2.0, 'max_level': 10},
 }
+# 엔티티 종류별 이미지: (크기, 색)
+ENTITY_IMAGES = {
+    'player': ((50, 50), BLUE), 'enemy': ((40, 40), RED), 'exp_gem': ((15, 15), YELLOW), 'exp_gem_large': ((22, 22), ORANGE),
+    'projectile': ((10, 10), WHITE), 'bible': ((30, 40), CYAN),
+}
+# 헤드리스 실행용 입력 스크립트: 틱 번호(FPS 기준으로 환산) -> 이동 방향
+INPUT_SCRIPTS = {
+    'idle':   lambda tick: (0, 0),
+    'circle': lambda tick: (math.cos(tick / 120), math.sin(tick / 120)),
+}
+
+
+# --- 이미지 캐시 ---
+class ImageCache:
+    """ 엔티티 종류마다 서피스를 하나만 만들어 공유한다. 화면이 있으면 디스플레이 픽셀 포맷으로 convert() 해 둔다 """
+    def __init__(self, specs): self.specs, self.images = specs, {}
+    def get(self, kind):
+        image = self.images.get(kind)
+        if image is None:
+            image = RESOURCES.surface(f"images/{kind}")
+            if image is None: size, color = self.specs[kind]; image = pygame.Surface(size); image.fill(color)
+            if pygame.display.get_surface(): image = image.convert()
+            self.images[kind] = image
+        return image
+    def clear(self): self.images.clear()
+
+IMAGE_CACHE = ImageCache(ENTITY_IMAGES)
+
+# --- 텍스트 캐시 ---
+class TextCache:
+    """ (폰트, 문자열, 색)마다 렌더링한 서피스를 보관하고, max_entries를 넘으면 가장 오래 안 쓴 것부터 버린다 """
+    def __init__(self, max_entries=256): self.max_entries, self.surfaces = max_entries, OrderedDict()
+    def render(self, font, text, color):
+        key = (font, text, color)
+        if (surf := self.surfaces.get(key)) is not None: self.surfaces.move_to_end(key); return surf
+        surf = self.surfaces[key] = font.render(text, True, color)
+        if len(self.surfaces) > self.max_entries: self.surfaces.popitem(last=False)
+        return surf
+    def clear(self): self.surfaces.clear()
+
+TEXT_CACHE = TextCache()
+
+# --- 폰트 캐시 ---
+FONT_FILE = "GmarketSansTTF/GmarketSansTTFMedium.ttf"
+BUNDLED_FILES = (FONT_FILE,)  # --pack-assets가 번들에 넣는 파일
+
+class FontCache:
+    """ 폰트 파일은 처음 필요할 때 한 번만 읽고(번들이면 mmap 구간), 크기별 Font는 그 버퍼로 처음 쓰일 때 만든다 """
+    def __init__(self, relative_path): self.relative_path, self.data, self.fonts = relative_path, None, {}
+    def get(self, size):
+        if (font := self.fonts.get(size)) is None:
+            if self.data is None: self.data = RESOURCES.view(self.relative_path)
+            font = self.fonts[size] = pygame.font.Font(BufferReader(self.data), size)
+        return font
+    def clear(self): self.fonts.clear()  # pygame.quit() 뒤에는 Font가 죽으므로 다음 Game이 새로 만들게 한다 (파일 버퍼는 유지)
+
+FONT_CACHE = FontCache(FONT_FILE)
 
+def pack_assets(path=ASSET_BUNDLE_FILE):
+    """ BUNDLED_FILES와 엔티티 이미지(미리 구운 RGB 픽셀)를 에셋 번들 하나로 묶는다 """
+    entries = {}
+    for relative_path in BUNDLED_FILES:
+        with open(resource_path(relative_path), 'rb') as f: entries[relative_path] = (f.read(), {})
+    for kind, (size, color) in ENTITY_IMAGES.items():
+        surface = pygame.Surface(size); surface.fill(color)
+        entries[f"images/{kind}"] = (pygame.image.tobytes(surface, 'RGB'), {'surface': [*size, 'RGB']})
+    AssetBundle.write(path, entries)
+    return path
 
 # --- 쿼드트리 클래스 ---
 class Quadtree:
@@ -89,6 +274,517 @@ class Quadtree:
         if index != -1 and self.nodes[0]: self.nodes[index].retrieve(return_objects, rect)
         return_objects.extend(self.objects)
         return return_objects
+    def rebuild(self, objects):
+        self.clear()
+        for obj in objects: self.insert(obj)
+    def query_radius(self, pos, radius):
+        rect, r_sq = pygame.Rect(pos.x - radius, pos.y - radius, radius * 2, radius * 2), radius ** 2
+        # retrieve()는 경계에 걸친 rect에서 자식 하나만 따라가 이웃을 놓치므로, 겹치는 노드를 모두 도는 query_rect로 후보를 모은다
+        return [obj for obj in self.query_rect(rect) if pos.distance_squared_to(obj.pos) < r_sq]
+    def query_rect(self, rect):
+        found = [obj for obj in self.objects if rect.colliderect(obj.rect)]
+        for node in self.nodes:
+            if node and node.bounds.colliderect(rect): found.extend(node.query_rect(rect))
+        return found
+    def all_objects(self):
+        found = list(self.objects)
+        for node in self.nodes:
+            if node: found.extend(node.all_objects())
+        return found
+    def nearest(self, pos, k=1, max_radius=None):
+        # 쿼드트리는 반경 질의가 부정확하므로 전체를 훑는다
+        candidates = self.all_objects()
+        if max_radius is not None: candidates = [o for o in candidates if pos.distance_squared_to(o.pos) <= max_radius ** 2]
+        return heapq.nsmallest(k, candidates, key=lambda o: pos.distance_squared_to(o.pos))
+
+# --- 공간 해시 그리드 클래스 ---
+class SpatialHash:
+    """ 균일 격자 공간 해시. 객체 중심(pos)이 속한 셀에 넣으며, 매 틱 rebuild로 통째로 다시 채운다 """
+    def __init__(self, cell_size):
+        self.cell_size, self.cells, self.cell_bounds = cell_size, {}, None
+    def clear(self): self.cells, self.cell_bounds = {}, None
+    def rebuild(self, objects):
+        cells, cs = {}, self.cell_size
+        for obj in objects:
+            key = (int(obj.pos.x // cs), int(obj.pos.y // cs))
+            bucket = cells.get(key)
+            if bucket is None: cells[key] = [obj]
+            else: bucket.append(obj)
+        self.cells = cells
+        if cells:
+            xs, ys = [key[0] for key in cells], [key[1] for key in cells]
+            self.cell_bounds = (min(xs), min(ys), max(xs), max(ys))
+        else: self.cell_bounds = None
+    def insert(self, obj):
+        cs = self.cell_size; key = (int(obj.pos.x // cs), int(obj.pos.y // cs))
+        self.cells.setdefault(key, []).append(obj)
+        b = self.cell_bounds or (key + key)
+        self.cell_bounds = (min(b[0], key[0]), min(b[1], key[1]), max(b[2], key[0]), max(b[3], key[1]))
+    def remove(self, obj):
+        # insert 이후 pos가 바뀌지 않은 객체만 지울 수 있다. cell_bounds는 넓은 채로 두어도 nearest가 정확하다
+        cs = self.cell_size; key = (int(obj.pos.x // cs), int(obj.pos.y // cs))
+        bucket = self.cells[key]; bucket.remove(obj)
+        if not bucket: del self.cells[key]
+    def _cells_in(self, left, top, right, bottom):
+        cs, cells = self.cell_size, self.cells
+        for cx in range(int(left // cs), int(right // cs) + 1):
+            for cy in range(int(top // cs), int(bottom // cs) + 1):
+                bucket = cells.get((cx, cy))
+                if bucket: yield bucket
+    def retrieve(self, return_objects, rect):
+        for bucket in self._cells_in(rect.left, rect.top, rect.right, rect.bottom): return_objects.extend(bucket)
+        return return_objects
+    def query_rect(self, rect):
+        """ rect와 겹치는 객체. 객체는 중심 셀에만 들어 있으므로 셀 한 칸만큼 넓혀 찾는다(객체가 셀보다 작다고 가정) """
+        cs, found = self.cell_size, []
+        for bucket in self._cells_in(rect.left - cs, rect.top - cs, rect.right + cs, rect.bottom + cs):
+            found.extend(obj for obj in bucket if rect.colliderect(obj.rect))
+        return found
+    def query_radius(self, pos, radius):
+        x, y, r_sq, found = pos.x, pos.y, radius ** 2, []
+        for bucket in self._cells_in(x - radius, y - radius, x + radius, y + radius):
+            for obj in bucket:
+                if pos.distance_squared_to(obj.pos) < r_sq: found.append(obj)
+        return found
+    def _ring(self, cx, cy, ring):
+        """ (cx, cy)에서 체비쇼프 거리가 정확히 ring인 셀들의 버킷 """
+        cells = self.cells
+        if ring == 0:
+            if bucket := cells.get((cx, cy)): yield bucket
+            return
+        for dx in range(-ring, ring + 1):
+            if bucket := cells.get((cx + dx, cy - ring)): yield bucket
+            if bucket := cells.get((cx + dx, cy + ring)): yield bucket
+        for dy in range(-ring + 1, ring):
+            if bucket := cells.get((cx - ring, cy + dy)): yield bucket
+            if bucket := cells.get((cx + ring, cy + dy)): yield bucket
+    def nearest(self, pos, k=1, max_radius=None):
+        """ pos에서 가까운 순으로 최대 k개. 셀 고리를 넓혀 가다 더 먼 고리에 더 가까운 후보가 있을 수 없으면 멈춘다 """
+        if not self.cell_bounds: return []
+        cs = self.cell_size; cx, cy = int(pos.x // cs), int(pos.y // cs)
+        min_x, min_y, max_x, max_y = self.cell_bounds
+        last_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+        if max_radius is not None: last_ring = min(last_ring, int(max_radius // cs) + 1)
+        limit_sq = float('inf') if max_radius is None else max_radius ** 2
+        found = []
+        for ring in range(max(last_ring, 0) + 1):
+            for bucket in self._ring(cx, cy, ring):
+                for obj in bucket:
+                    d_sq = pos.distance_squared_to(obj.pos)
+                    if d_sq <= limit_sq: found.append((d_sq, obj))
+            # 고리 ring 바깥의 셀은 pos에서 최소 ring * cs 떨어져 있다
+            if len(found) >= k and heapq.nsmallest(k, found, key=lambda item: item[0])[-1][0] <= (ring * cs) ** 2: break
+        return [obj for _, obj in heapq.nsmallest(k, found, key=lambda item: item[0])]
+
+# --- 벡터화 적 엔진 (NumPy) ---
+def neighbor_pairs(pos, radius):
+    """ pos 배열에서 거리가 radius 미만인 (i, j) 쌍(i != j)과 pos[i] - pos[j]를 셀 정렬로 한 번에 구한다 """
+    n = len(pos)
+    cell = np.floor(pos / radius).astype(np.int64)
+    cx, cy = cell[:, 0] - cell[:, 0].min() + 1, cell[:, 1] - cell[:, 1].min() + 1
+    width = int(cx.max()) + 2
+    key = cy * width + cx
+    order = np.argsort(key, kind='stable')
+    cell_count = np.bincount(key, minlength=(int(cy.max()) + 2) * width)
+    cell_start = np.cumsum(cell_count) - cell_count
+    # 자기 셀과 주변 8셀을 한 번에 펼친다 (가장자리에 빈 셀 한 줄씩을 두어 인덱스가 넘치지 않는다)
+    offsets = np.array([dy * width + dx for dy in (-1, 0, 1) for dx in (-1, 0, 1)])
+    neighbor_key = (key[:, None] + offsets).ravel()
+    counts = cell_count[neighbor_key]
+    total = int(counts.sum())
+    first = np.repeat(cell_start[neighbor_key] - (np.cumsum(counts) - counts), counts)
+    i, j = np.repeat(np.arange(n), counts.reshape(n, 9).sum(1)), order[first + np.arange(total)]
+    delta = pos[i] - pos[j]
+    close = (i != j) & (np.einsum('ij,ij->i', delta, delta) < radius ** 2)
+    return i[close], j[close], delta[close]
+
+def steer_horde(pos, speed, target, radius, heading=None):
+    """ Enemy.update의 인력/분리 조향을 적 전체에 대해 배열 연산으로 계산해 이번 틱 이동량을 반환한다.
+    heading(적마다 단위 방향, 예: 플로우 필드)을 주면 목표 쪽 직선 방향 대신 그것을 따라간다 """
+    n = len(pos)
+    attraction = np.asarray(target, dtype=float) - pos
+    dist = np.hypot(attraction[:, 0], attraction[:, 1])
+    moving = dist > radius
+    direction = np.zeros_like(pos)
+    direction[moving] = attraction[moving] / dist[moving, None] if heading is None else heading[moving]
+    i, _, delta = neighbor_pairs(pos, radius)
+    separation = np.column_stack((np.bincount(i, delta[:, 0], n), np.bincount(i, delta[:, 1], n)))
+    sep_len = np.hypot(separation[:, 0], separation[:, 1])
+    blend = moving & (sep_len > 0)
+    direction[blend] = direction[blend] * 0.7 + separation[blend] / sep_len[blend, None] * 0.3
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    step = np.zeros_like(pos); ok = length > 0
+    step[ok] = direction[ok] / length[ok, None] * speed[ok, None]
+    return step
+
+class EnemyHorde:
+    """ 살아있는 적의 위치/속도/체력을 NumPy 배열로 보관하고 매 틱 한꺼번에 조향한다. 스프라이트에는 결과만 되돌려 쓴다 """
+    def __init__(self, capacity=256):
+        self.count, self.enemies = 0, []
+        self.pos, self.speed, self.hp = np.zeros((capacity, 2)), np.zeros(capacity), np.zeros(capacity)
+        self.lod_bucket = np.zeros(capacity, np.int64)
+    def _grow(self):
+        capacity = len(self.speed) * 2
+        self.pos = np.resize(self.pos, (capacity, 2)); self.speed = np.resize(self.speed, capacity); self.hp = np.resize(self.hp, capacity)
+        self.lod_bucket = np.resize(self.lod_bucket, capacity)
+    def add(self, enemy):
+        if self.count == len(self.speed): self._grow()
+        i = self.count; enemy.slot = i; self.enemies.append(enemy); self.count += 1
+        self.pos[i], self.speed[i], self.hp[i], self.lod_bucket[i] = enemy.pos, enemy.speed, enemy._hp, enemy.lod_bucket
+    def remove(self, enemy):
+        i, last = enemy.slot, self.count - 1
+        enemy._hp = float(self.hp[i])
+        if i != last:
+            moved = self.enemies[last]; self.enemies[i], moved.slot = moved, i
+            self.pos[i], self.speed[i], self.hp[i] = self.pos[last], self.speed[last], self.hp[last]
+            self.lod_bucket[i] = self.lod_bucket[last]
+        self.enemies.pop(); self.count -= 1; enemy.slot = None
+    def reset(self):
+        """ 새 판: 적만 비우고 배열(샤드 엔진이면 워커와 공유 메모리까지)은 그대로 다시 쓴다 """
+        self.count, self.enemies = 0, []
+    def step(self, target, tick=0, lod_view=None, flow_field=None):
+        """ lod_view(월드 좌표 Rect)가 주어지면 Enemy.update와 같은 LOD 규칙으로 먼 적을 띄엄띄엄 움직인다.
+        flow_field가 주어지면 목표 쪽 직선 대신 필드 방향을 따라간다 """
+        n = self.count
+        if n == 0: return
+        pos, speed, goal = self.pos[:n], self.speed[:n], (target.x, target.y)
+        attraction = np.array(goal) - pos
+        heading = flow_field.sample_array(pos, attraction) if flow_field else None
+        if lod_view is None: pos += self.steer(n, goal, heading, None); moved = None
+        else:
+            dist_sq = np.einsum('ij,ij->i', attraction, attraction)
+            on_screen = ((pos[:, 0] >= lod_view.left) & (pos[:, 0] < lod_view.right)
+                         & (pos[:, 1] >= lod_view.top) & (pos[:, 1] < lod_view.bottom))
+            near = (dist_sq <= LOD_DISTANCE ** 2) | on_screen
+            far_due = ~near & ((self.lod_bucket[:n] + tick) % LOD_BUCKETS == 0)
+            if near.any(): pos[near] += self.steer(n, goal, heading, near)
+            if far_due.any():
+                far_heading = attraction[far_due] / np.sqrt(dist_sq[far_due])[:, None] if heading is None else heading[far_due]
+                pos[far_due] += far_heading * (speed[far_due] * LOD_BUCKETS)[:, None]
+            moved = np.flatnonzero(near | far_due)
+        if moved is None:
+            for enemy, xy in zip(self.enemies, pos.tolist()): enemy.pos.update(xy); enemy.rect.center = xy
+        else:
+            enemies = self.enemies
+            for i, xy in zip(moved.tolist(), pos[moved].tolist()): enemy = enemies[i]; enemy.pos.update(xy); enemy.rect.center = xy
+    def steer(self, n, goal, heading, near):
+        """ near(불리언 마스크, None이면 전부)에 해당하는 적의 이번 틱 조향 이동량 """
+        pos, speed = self.pos[:n], self.speed[:n]
+        if near is None: return steer_horde(pos, speed, goal, ENEMY_SEPARATION_RADIUS, heading)
+        return steer_horde(pos[near], speed[near], goal, ENEMY_SEPARATION_RADIUS, None if heading is None else heading[near])
+    def close(self): pass
+
+# --- 멀티프로세스 샤드 조향 ---
+# 워커는 spawn으로 띄운다: SDL과 세이브 스레드가 돌고 있는 메인을 fork하면 잠금이 걸린 채 복사될 수 있다 (윈도우는 원래 spawn)
+SHARD_CONTEXT = multiprocessing.get_context('spawn')
+HORDE_SHARED_FIELDS = (('pos', 2, 'f8'), ('speed', 1, 'f8'), ('heading', 2, 'f8'), ('step', 2, 'f8'), ('active', 1, '?'))
+
+def horde_shared_views(buf, capacity):
+    """ 공유 메모리 한 블록을 HORDE_SHARED_FIELDS 순서의 배열들로 나눠 본다. buf가 None이면 필요한 바이트 수만 반환 """
+    views, offset = {}, 0
+    for name, width, dtype in HORDE_SHARED_FIELDS:
+        shape = (capacity, width) if width > 1 else (capacity,)
+        if buf is not None: views[name] = np.ndarray(shape, dtype, buffer=buf, offset=offset)
+        offset += capacity * width * np.dtype(dtype).itemsize
+    return views if buf is not None else offset
+
+def shard_worker(conn):
+    """ ShardedHorde 워커 프로세스. 메인이 보낸 세로 띠 [x0, x1)에 속한 적을 조향해 공유 step 버퍼에 쓴다.
+    띠 양옆 분리 반경 안의 적(고스트)도 이웃으로 읽기만 해서 경계의 분리 결과가 단일 프로세스와 같다 """
+    shm = views = None
+    while (msg := conn.recv()) is not None:
+        if msg[0] == 'attach':
+            views = None
+            if shm: shm.close()
+            shm = shared_memory.SharedMemory(name=msg[1]); views = horde_shared_views(shm.buf, msg[2])
+        else:
+            _, n, goal, x0, x1 = msg
+            pos, x, r = views['pos'][:n], views['pos'][:n, 0], ENEMY_SEPARATION_RADIUS
+            idx = np.flatnonzero(views['active'][:n] & (x >= x0 - r) & (x < x1 + r))
+            own = (x[idx] >= x0) & (x[idx] < x1)
+            if idx.size: views['step'][idx[own]] = steer_horde(pos[idx], views['speed'][idx], goal, r, views['heading'][idx])[own]
+        conn.send(True)
+    views = None
+    if shm: shm.close()
+
+class ShardedHorde(EnemyHorde):
+    """ 근거리 적 조향을 적 x좌표 분위수로 나눈 세로 띠 샤드별로 워커 프로세스에서 돌리는 EnemyHorde.
+    위치/속도/방향/결과 배열은 공유 메모리에 두고 파이프로는 띠 경계만 주고받는다. 충돌과 그리기는 메인 프로세스에 남는다 """
+    def __init__(self, workers=None, capacity=256):
+        super().__init__(capacity)
+        self.workers, self.shm, self.conns, self.procs = max(1, workers or os.cpu_count() or 1), None, [], []
+        # 공유 메모리를 워커보다 먼저 만들어야 워커들이 메인의 resource_tracker를 물려받아 블록을 먼저 지우지 않는다
+        self._share(capacity)
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # spawn 워커가 모듈을 다시 import할 때 pygame 인사말을 찍지 않게 한다
+        for _ in range(self.workers):
+            parent, child = SHARD_CONTEXT.Pipe()
+            proc = SHARD_CONTEXT.Process(target=shard_worker, args=(child,), daemon=True); proc.start()
+            self.conns.append(parent); self.procs.append(proc)
+        self.broadcast(('attach', self.shm.name, capacity))
+    def _share(self, capacity):
+        """ capacity 크기의 공유 메모리를 새로 잡아 지금 위치/속도를 옮기고 워커들을 거기에 다시 붙인다 """
+        old, n = self.shm, self.count
+        self.shm = shared_memory.SharedMemory(create=True, size=horde_shared_views(None, capacity))
+        views = horde_shared_views(self.shm.buf, capacity)
+        views['pos'][:n], views['speed'][:n] = self.pos[:n], self.speed[:n]
+        self.pos, self.speed, self.heading, self.step_out, self.active = (views[name] for name, _, _ in HORDE_SHARED_FIELDS)
+        self.broadcast(('attach', self.shm.name, capacity))
+        if old: old.close(); old.unlink()
+    def _grow(self):
+        capacity = len(self.speed) * 2
+        self.hp = np.resize(self.hp, capacity); self.lod_bucket = np.resize(self.lod_bucket, capacity)
+        self._share(capacity)
+    def broadcast(self, msg):
+        """ 모든 워커에 같은 메시지를 보내고 전부 끝날 때까지 기다린다 """
+        for conn in self.conns: conn.send(msg)
+        for conn in self.conns: conn.recv()
+    def steer(self, n, goal, heading, near):
+        if (n if near is None else np.count_nonzero(near)) < SHARD_MIN_ENEMIES: return super().steer(n, goal, heading, near)
+        pos = self.pos[:n]
+        if heading is None:
+            heading = np.asarray(goal, dtype=float) - pos; dist = np.hypot(heading[:, 0], heading[:, 1]); ok = dist > 0
+            heading[ok] /= dist[ok, None]
+        self.heading[:n], self.active[:n] = heading, True if near is None else near
+        # 샤드마다 적 수가 비슷하도록 조향 대상 x좌표의 분위수로 띠 경계를 잡는다
+        edges = np.quantile(pos[:, 0] if near is None else pos[near, 0], np.linspace(0, 1, self.workers + 1))
+        edges[0], edges[-1] = -np.inf, np.inf
+        for conn, x0, x1 in zip(self.conns, edges[:-1].tolist(), edges[1:].tolist()): conn.send(('steer', n, goal, x0, x1))
+        for conn in self.conns: conn.recv()
+        return self.step_out[:n].copy() if near is None else self.step_out[:n][near]
+    def close(self):
+        """ 워커를 내리고 공유 메모리를 해제한다. 배열은 사본으로 바꿔 둬서 이후에도 읽을 수 있다 """
+        for conn in self.conns: conn.send(None)
+        for proc in self.procs: proc.join(timeout=1)
+        self.conns, self.procs = [], []
+        if self.shm:
+            self.pos, self.speed = self.pos.copy(), self.speed.copy(); self.heading = self.step_out = self.active = None
+            self.shm.close(); self.shm.unlink(); self.shm = None
+
+# --- 플로우 필드 ---
+class FlowField:
+    """ 월드를 격자로 나눠 셀마다 목표(플레이어) 쪽 단위 방향을 둔다. 목표가 다른 셀로 옮겨 갈 때만 다시 계산하고 적은 자기 셀 값을 읽는다.
+    장애물이 없으면 필드 방향은 목표 쪽 직선과 같으므로 적은 blocked가 있을 때만 필드를 읽는다.
+    다시 계산은 틱마다 FLOW_INTEGRATE_BUDGET 셀씩 나눠 하고, 끝날 때까지 적은 직전 필드를 따라간다 """
+    NEIGHBORS = [(dx, dy, math.hypot(dx, dy)) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+    def __init__(self, world_w, world_h, cell_size=FLOW_CELL_SIZE):
+        self.cell_size, self.cols, self.rows = cell_size, -(-world_w // cell_size), -(-world_h // cell_size)
+        self.blocked, self.target_cell, self.directions, self.field_array = set(), None, [], None
+        self.edges, self.pending = None, None
+    def cell_of(self, x, y):
+        return min(self.cols - 1, max(0, int(x // self.cell_size))), min(self.rows - 1, max(0, int(y // self.cell_size)))
+    def add_obstacle(self, rect):
+        """ rect(월드 좌표)가 덮는 셀을 지나갈 수 없게 막는다. 예전 필드는 버리고 다음 update에서 한 번에 새로 만든다 """
+        cs = self.cell_size
+        for cx in range(max(0, rect.left // cs), min(self.cols, (rect.right - 1) // cs + 1)):
+            for cy in range(max(0, rect.top // cs), min(self.rows, (rect.bottom - 1) // cs + 1)): self.blocked.add(cy * self.cols + cx)
+        self.target_cell, self.directions, self.field_array, self.edges, self.pending = None, [], None, None, None
+    def update(self, target_pos):
+        """ 목표가 셀을 옮기면 새 필드 계산을 시작하고, 진행 중인 계산을 이번 틱 몫만큼 이어 간다. 새 필드로 바뀌면 True를 반환 """
+        if not self.blocked: return False
+        cell = self.cell_of(target_pos.x, target_pos.y)
+        if cell != self.target_cell:
+            self.target_cell, self.pending = cell, self.integrate(cell)
+            if not self.directions:  # 처음이거나 장애물이 바뀐 직후라 따라갈 필드가 없으면 끝까지 계산한다
+                for _ in self.pending: pass
+                return True
+        if self.pending is None: return False
+        next(self.pending, None)  # 조각 사이에서도 None을 내므로 끝났는지는 pending으로 본다
+        return self.pending is None
+    def build_edges(self):
+        """ 셀마다 지나갈 수 있는 이웃 목록 [(이웃, 비용, 단위 dx, 단위 dy)]. 장애물이 바뀔 때만 만든다 (모서리 끼기 금지) """
+        cols, rows, blocked = self.cols, self.rows, self.blocked
+        edges = []
+        for i in range(cols * rows):
+            x, y = i % cols, i // cols; out = []
+            for dx, dy, step in self.NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < cols and 0 <= ny < rows) or ny * cols + nx in blocked: continue
+                if dx and dy and (y * cols + nx in blocked or ny * cols + x in blocked): continue
+                out.append((ny * cols + nx, step, dx / step, dy / step))
+            edges.append(out)
+        self.edges = edges
+    def integrate(self, target_cell):
+        """ 목표 셀부터 다익스트라로 비용을 퍼뜨리며 각 셀이 자기를 처음 싸게 이은 셀 쪽을 가리키게 한다.
+        FLOW_INTEGRATE_BUDGET 셀마다 한 번 양보하는 제너레이터이고, 다 끝나면 directions를 통째로 바꾼다 """
+        if self.edges is None: self.build_edges()
+        edges, budget = self.edges, FLOW_INTEGRATE_BUDGET
+        tx, ty = target_cell; start = ty * self.cols + tx
+        cost = [math.inf] * len(edges); cost[start] = 0; heap = [(0, start)]
+        directions = [(0.0, 0.0)] * len(edges)
+        while heap:
+            c, i = heapq.heappop(heap)
+            if c > cost[i]: continue
+            for j, step, ux, uy in edges[i]:
+                if c + step < cost[j]: cost[j] = c + step; directions[j] = (-ux, -uy); heapq.heappush(heap, (c + step, j))
+            budget -= 1
+            if budget == 0: yield; budget = FLOW_INTEGRATE_BUDGET
+        self.directions, self.field_array, self.pending = directions, None, None
+    def direction(self, pos, to_target):
+        """ pos에 있는 적이 따라갈 단위 방향. 목표와 같은 셀이거나 필드 방향이 없는 셀(막힘, 직전 목표 셀)에서는 to_target 직선 방향 """
+        cx, cy = self.cell_of(pos.x, pos.y); d = self.directions[cy * self.cols + cx]
+        if (cx, cy) == self.target_cell or d == (0.0, 0.0):
+            return to_target.normalize() if to_target.length_squared() > 0 else pygame.math.Vector2(0, 0)
+        return pygame.math.Vector2(d)
+    def sample_array(self, pos, to_target):
+        """ direction()의 배열 버전 (EnemyHorde용) """
+        cs, (tx, ty) = self.cell_size, self.target_cell
+        cx = np.clip((pos[:, 0] // cs).astype(np.int64), 0, self.cols - 1); cy = np.clip((pos[:, 1] // cs).astype(np.int64), 0, self.rows - 1)
+        if self.field_array is None: self.field_array = np.array(self.directions)
+        heading = self.field_array[cy * self.cols + cx]
+        near = ((cx == tx) & (cy == ty)) | ~heading.any(axis=1)
+        heading[near] = to_target[near]
+        length = np.hypot(heading[:, 0], heading[:, 1]); ok = length > 0
+        heading[ok] /= length[ok, None]
+        return heading
+
+ENEMY_ENGINES = ('python', 'numpy', 'sharded')
+SPATIAL_INDEX_FACTORIES = {
+    'hash': lambda: SpatialHash(ENEMY_SEPARATION_RADIUS),
+    'quadtree': lambda: Quadtree(0, (0, 0, WORLD_WIDTH, WORLD_HEIGHT)),
+}
+
+# --- 충돌 브로드페이즈 ---
+class CollisionGrid:
+    """ 충돌 대상 엔티티를 레이어별로 중심 셀에 넣는 공용 격자. 매 틱 한 번 채우고, 레이어 쌍마다 주변 셀 후보만 rect로 검사한다 """
+    def __init__(self, cell_size=64): self.cell_size, self.cells, self.extents, self.layers = cell_size, {}, {}, {}
+    def rebuild(self, layers):
+        cs, cells, extents = self.cell_size, {}, {}
+        for name, sprites in layers.items():
+            extent = 0
+            for sprite in sprites:
+                rect = sprite.rect; key = (rect.centerx // cs, rect.centery // cs, name)
+                bucket = cells.get(key)
+                if bucket is None: cells[key] = [sprite]
+                else: bucket.append(sprite)
+                if rect.width > extent: extent = rect.width
+                if rect.height > extent: extent = rect.height
+            extents[name] = extent
+        self.cells, self.extents, self.layers = cells, extents, layers
+    def collide(self, rect, layer):
+        """ layer에서 rect와 겹치는 엔티티. 중심이 rect 밖에 있어도 레이어의 최대 크기 절반 안이면 후보가 된다 """
+        cs, cells, half = self.cell_size, self.cells, self.extents.get(layer, 0) // 2 + 1
+        found = []
+        for cx in range((rect.left - half) // cs, (rect.right + half) // cs + 1):
+            for cy in range((rect.top - half) // cs, (rect.bottom + half) // cs + 1):
+                bucket = cells.get((cx, cy, layer))
+                if bucket: found.extend(other for other in bucket if rect.colliderect(other.rect))
+        return found
+    def pairs(self, layer_a, layer_b):
+        """ layer_a 엔티티마다 겹치는 layer_b 엔티티 목록 {a: [b, ...]} """
+        return {a: hits for a in self.layers[layer_a] if (hits := self.collide(a.rect, layer_b))}
+
+# --- 프레임 프로파일러 ---
+PROFILE_PHASES = ('flow_field', 'sprite_update', 'steering', 'spawning', 'broadphase', 'collide_projectile', 'collide_contact',
+                  'gem_pickup', 'collide_skill', 'index_build', 'background', 'sprite_blit', 'hud')
+PROFILE_COUNTS = ('enemies', 'projectiles', 'gems')
+
+class FrameProfiler:
+    """ 프레임을 단계별로 재(ms) 최근 window 프레임의 p50/p95/p99를 내고, 원하면 프레임마다 CSV 한 줄씩 쓴다 """
+    _NULL_PHASE = contextlib.nullcontext()
+    def __init__(self, window=300, csv_path=None):
+        self.window, self.overlay_visible, self.overlay_surface = window, False, None
+        self.history = {name: deque(maxlen=window) for name in ('frame',) + PROFILE_PHASES}
+        self.frame, self.counts, self.frame_index, self.current, self.started = {}, {}, 0, None, 0
+        self.csv_file = open(csv_path, 'w', newline='') if csv_path else None
+        if self.csv_file:
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(('frame', 'frame_ms') + tuple(f"{name}_ms" for name in PROFILE_PHASES) + PROFILE_COUNTS)
+    @property
+    def enabled(self): return self.overlay_visible or self.csv_file is not None
+    def toggle_overlay(self): self.overlay_visible = not self.overlay_visible; self.overlay_surface = None
+    def begin_frame(self):
+        if self.enabled: self.frame = {}; self.started = time.perf_counter()
+    def phase(self, name):
+        """ with profiler.phase('이름'): 형태로 쓴다. 꺼져 있으면 아무것도 재지 않는다 """
+        if not self.enabled: return self._NULL_PHASE
+        self.current = name; return self
+    def __enter__(self): self.phase_started = time.perf_counter()
+    def __exit__(self, *exc_info):
+        self.frame[self.current] = self.frame.get(self.current, 0) + (time.perf_counter() - self.phase_started) * 1000
+    def end_frame(self, counts):
+        if not self.enabled: return
+        self.frame['frame'] = (time.perf_counter() - self.started) * 1000
+        for name, samples in self.history.items(): samples.append(self.frame.get(name, 0))
+        self.counts, self.frame_index = counts, self.frame_index + 1
+        if self.csv_file:
+            self.csv_writer.writerow((self.frame_index, round(self.frame['frame'], 4))
+                                     + tuple(round(self.frame.get(name, 0), 4) for name in PROFILE_PHASES)
+                                     + tuple(counts.get(name, 0) for name in PROFILE_COUNTS))
+    def percentiles(self, name):
+        samples = sorted(self.history[name])
+        if not samples: return 0, 0, 0
+        return tuple(samples[min(len(samples) - 1, int(len(samples) * q))] for q in (0.5, 0.95, 0.99))
+    def draw_overlay(self, surface, font):
+        # 글자는 15프레임마다 한 번만 다시 그린다
+        if self.overlay_surface is None or self.frame_index % 15 == 0:
+            lines = [f"{'phase':<20}{'p50':>8}{'p95':>8}{'p99':>8}  (ms)"]
+            for name in ('frame',) + PROFILE_PHASES:
+                lines.append(f"{name:<20}" + ''.join(f"{v:>8.2f}" for v in self.percentiles(name)))
+            lines.append('  '.join(f"{name}: {self.counts.get(name, 0)}" for name in PROFILE_COUNTS))
+            rendered = [font.render(line, True, WHITE) for line in lines]
+            height = sum(r.get_height() for r in rendered)
+            self.overlay_surface = pygame.Surface((max(r.get_width() for r in rendered) + 16, height + 16), pygame.SRCALPHA)
+            self.overlay_surface.fill((0, 0, 0, 170)); y = 8
+            for r in rendered: self.overlay_surface.blit(r, (8, y)); y += r.get_height()
+        surface.blit(self.overlay_surface, (10, 90))
+    def close(self):
+        if self.csv_file: self.csv_file.close(); self.csv_file = None
+
+# --- 타일 배경 ---
+class TiledBackground:
+    """ 월드 배경을 정사각형 타일로 나눠 카메라에 걸친 타일만 그린다. 타일은 처음 보일 때 만들고 LRU로 max_tiles개만 보관한다 """
+    def __init__(self, world_w, world_h, tile_size=512, max_tiles=16, grid_size=100):
+        self.world_width, self.world_height, self.tile_size = world_w, world_h, tile_size
+        self.max_tiles, self.grid_size, self.tiles = max_tiles, grid_size, OrderedDict()
+    def render_tile(self, tx, ty):
+        ts, gs = self.tile_size, self.grid_size
+        x0, y0 = tx * ts, ty * ts
+        w, h = min(ts, self.world_width - x0), min(ts, self.world_height - y0)
+        tile = pygame.Surface((w, h)); tile.fill(DARK_GREY)
+        for x in range(-(-x0 // gs) * gs, x0 + w, gs): pygame.draw.line(tile, LIGHT_GREY, (x - x0, 0), (x - x0, h))
+        for y in range(-(-y0 // gs) * gs, y0 + h, gs): pygame.draw.line(tile, LIGHT_GREY, (0, y - y0), (w, y - y0))
+        return tile.convert() if pygame.display.get_surface() else tile
+    def get_tile(self, tx, ty):
+        key = (tx, ty)
+        if (tile := self.tiles.get(key)) is not None: self.tiles.move_to_end(key); return tile
+        tile = self.tiles[key] = self.render_tile(tx, ty)
+        if len(self.tiles) > self.max_tiles: self.tiles.popitem(last=False)
+        return tile
+    def draw(self, surface, camera):
+        ts, (ox, oy) = self.tile_size, camera.rect.topleft
+        left, top = max(0, -ox), max(0, -oy)
+        right = min(self.world_width, left + surface.get_width()) - 1
+        bottom = min(self.world_height, top + surface.get_height()) - 1
+        surface.blits([(self.get_tile(tx, ty), (tx * ts + ox, ty * ts + oy))
+                       for ty in range(top // ts, bottom // ts + 1) for tx in range(left // ts, right // ts + 1)], doreturn=False)
+
+# --- 엔티티 레지스트리 ---
+class Entity:
+    """ 게임 엔티티의 바탕. pygame Sprite 대신 __slots__만 두고, 자기가 든 EntityList와 그 안의 자리(index)를 직접 기억한다 """
+    __slots__ = ('image', 'rect', 'pos', 'registry', 'index')
+    def __init__(self): self.registry, self.index = None, -1
+    def alive(self): return self.registry is not None
+    def kill(self):
+        if self.registry is not None: self.registry.remove(self)
+    def update(self): pass
+
+class EntityList:
+    """ 한 종류 엔티티의 밀집 리스트. 추가는 끝에 붙이고 제거는 마지막 원소를 그 자리로 옮겨 둘 다 O(1)이다 (순서는 유지하지 않는다) """
+    __slots__ = ('items',)
+    def __init__(self): self.items = []
+    def add(self, entity):
+        entity.registry, entity.index = self, len(self.items); self.items.append(entity)
+    def remove(self, entity):
+        items, i = self.items, entity.index
+        last = items.pop()
+        if last is not entity: items[i], last.index = last, i
+        entity.registry, entity.index = None, -1
+    def update(self):
+        """ 뒤에서부터 갱신한다. update 안에서 자기 자신을 제거해도 아직 갱신 안 된 원소가 건너뛰어지지 않는다 """
+        items = self.items
+        for i in range(len(items) - 1, -1, -1): items[i].update()
+    def __iter__(self): return iter(self.items)
+    def __len__(self): return len(self.items)
 
 # --- 스킬 관련 클래스들 ---
 class Skill:
@@ -109,6 +805,7 @@ class Skill:
             if hasattr(self, method_name): getattr(self, method_name)()
         self.exp = 0
     def get_upgrade_options(self): raise NotImplementedError
+    def hit_enemies(self): return ()  # 궤도형처럼 직접 닿는 스킬만 이번 틱에 맞힌 적을 돌려준다
     def on_remove(self): pass
 
 class MagicBulletSkill(Skill):
@@ -117,40 +814,73 @@ class MagicBulletSkill(Skill):
         self.damage, self.cooldown, self.projectile_speed = 10, 500, 10
         self.last_shot_time = 0
     def update(self):
-        now = pygame.time.get_ticks()
+        now = self.game.clock.now
         if now - self.last_shot_time > self.cooldown:
             self.last_shot_time = now
             if target_enemy := self.player.find_closest_enemy():
-                Projectile(self.game, self.player.pos, target_enemy, self)
+                self.game.spawn_projectile(self.player.pos, target_enemy, self)
     def get_upgrade_options(self):
         return ['MAGIC_BULLET_DAMAGE', 'MAGIC_BULLET_COOLDOWN', 'MAGIC_BULLET_SPEED']
 
-class BibleSprite(pygame.sprite.Sprite):
+class BibleSprite(Entity):
+    """ 궤도 위의 책 한 권. 위치는 BibleSkill.update가 스킬 단위로 한꺼번에 정한다 """
+    __slots__ = ('game', 'skill')
     def __init__(self, game, skill_instance):
         super().__init__(); self.game, self.skill = game, skill_instance
-        self.image = pygame.Surface((30, 40)); self.image.fill(CYAN); self.rect = self.image.get_rect()
-        self.pos, self.angle = pygame.math.Vector2(0, 0), 0
-    def update(self):
-        self.angle = (self.angle + self.skill.rotation_speed) % 360
-        self.pos.x = self.game.player.pos.x + math.cos(math.radians(self.angle)) * self.skill.orbit_radius
-        self.pos.y = self.game.player.pos.y + math.sin(math.radians(self.angle)) * self.skill.orbit_radius
-        self.rect.center = self.pos
+        self.image = IMAGE_CACHE.get('bible'); self.rect = self.image.get_rect()
+        self.pos = pygame.math.Vector2(0, 0)
 
 class BibleSkill(Skill):
+    """ 플레이어 주위를 도는 책들. 책은 기준 각도에서 같은 간격으로 놓이므로 위치와 명중 판정을 스킬 하나당 한 번에 계산한다 """
+    HIT_HALF = tuple((b + e) / 2 for b, e in zip(ENTITY_IMAGES['bible'][0], ENTITY_IMAGES['enemy'][0]))  # 책/적 rect가 겹치는 중심 간 x, y 거리
     def __init__(self, player, skill_key='bible'):
         super().__init__(player, skill_key)
         self.damage, self.count, self.orbit_radius, self.rotation_speed = 15, 1, 100, 2
-        self.sprites = pygame.sprite.Group(); self.recreate_sprites()
-    def update(self): pass
+        self.angle, self.swept = 0.0, 0.0  # 기준 각도와 이번 틱에 돈 각도(도)
+        self.sprites, self.offsets = [], []; self.recreate_sprites()
+    def update(self):
+        # 기준 각도의 cos/sin 한 번과 책별 고정 오프셋(덧셈정리)으로 모든 책 위치를 구한다
+        self.swept = self.rotation_speed * self.game.move_scale
+        self.angle = (self.angle + self.swept) % 360
+        rad = math.radians(self.angle); c, s = math.cos(rad), math.sin(rad)
+        px, py, r = self.player.pos.x, self.player.pos.y, self.orbit_radius
+        for sprite, (oc, os_) in zip(self.sprites, self.offsets):
+            pos = sprite.pos; pos.x, pos.y = px + (c * oc - s * os_) * r, py + (s * oc + c * os_) * r
+            sprite.rect.center = pos
+    def hit_enemies(self):
+        """ 이번 틱에 책 rect가 쓸고 지나간 적. 두 rect가 겹치는 것은 책 중심이 적 중심 둘레 HIT_HALF 사각형 안에 드는 것과 같으므로,
+        책 중심이 그린 호가 그 사각형과 만나는지를 식으로 푼다. 책은 360/count 간격으로 같은 호를 돌아 각도를 그 간격으로 접어 한 번에 본다 """
+        r, (hw, hh), (px, py) = self.orbit_radius, self.HIT_HALF, self.player.rect.center
+        reach = math.hypot(hw, hh); size = int(r + reach) * 2 + 2
+        box = pygame.Rect(0, 0, size, size); box.center = (px, py)
+        step, start, swept = 360 / self.count, self.angle - self.swept, self.swept
+        rad = math.radians(start); c, s = math.cos(rad), math.sin(rad)
+        starts = [((c * oc - s * os_) * r, (s * oc + c * os_) * r) for oc, os_ in self.offsets]  # 이번 틱 시작 때의 책 중심
+        hits = []
+        for enemy in self.game.collision_grid.collide(box, 'enemy'):
+            ex, ey = enemy.rect.centerx - px, enemy.rect.centery - py
+            if abs(math.hypot(ex, ey) - r) > reach: continue
+            x0, x1, y0, y1 = ex - hw, ex + hw, ey - hh, ey + hh
+            # 어느 책의 호가 사각형 안에서 시작하거나, 쓸린 호가 사각형의 변(원과 변의 교점)을 지나면 맞은 것이다
+            if any(x0 < bx < x1 and y0 < by < y1 for bx, by in starts): hits.append(enemy); continue
+            crossings = []
+            for edge in (x0, x1):
+                if abs(edge) < r: h = math.sqrt(r * r - edge * edge); crossings += [(edge, h), (edge, -h)]
+            for edge in (y0, y1):
+                if abs(edge) < r: h = math.sqrt(r * r - edge * edge); crossings += [(h, edge), (-h, edge)]
+            if any(x0 <= x <= x1 and y0 <= y <= y1 and (math.degrees(math.atan2(y, x)) - start) % step <= swept for x, y in crossings):
+                hits.append(enemy)
+        return hits
     def get_upgrade_options(self): return ['BIBLE_DAMAGE', 'BIBLE_COUNT', 'BIBLE_SPEED']
     def recreate_sprites(self):
-        for sprite in self.sprites: sprite.kill()
+        self.on_remove()
         angle_step = 360 / self.count
         for i in range(self.count):
-            sprite = BibleSprite(self.game, self); sprite.angle = i * angle_step
-            self.sprites.add(sprite); self.game.all_sprites.add(sprite); self.game.skill_sprites.add(sprite)
+            sprite = BibleSprite(self.game, self); rad = math.radians(i * angle_step)
+            self.sprites.append(sprite); self.offsets.append((math.cos(rad), math.sin(rad))); self.game.skill_sprites.add(sprite)
     def on_remove(self):
         for sprite in self.sprites: sprite.kill()
+        self.sprites, self.offsets = [], []
 
 SKILL_CLASSES = {'magic_bullet': MagicBulletSkill, 'bible': BibleSkill}
 
@@ -159,12 +889,17 @@ class Button:
     def __init__(self, x, y, w, h, text, font, bg=UI_OPTION_BG_COLOR, border=UI_BORDER_COLOR):
         self.rect, self.text, self.font = pygame.Rect(x, y, w, h), text, font
         self.bg_color, self.border_color, self.is_hovered = bg, border, False
+        self.hover_color = tuple(min(c + 30, 255) for c in bg)
+    def update_hover(self, pos):
+        """ 마우스 위치로 hover 상태를 갱신하고, 바뀌었으면 True """
+        hovered = self.rect.collidepoint(pos)
+        changed, self.is_hovered = hovered != self.is_hovered, hovered
+        return changed
     def draw(self, surface):
-        self.is_hovered = self.rect.collidepoint(pygame.mouse.get_pos())
-        color = tuple(min(c + 30, 255) for c in self.bg_color) if self.is_hovered else self.bg_color
+        color = self.hover_color if self.is_hovered else self.bg_color
         pygame.draw.rect(surface, color, self.rect, border_radius=10)
         pygame.draw.rect(surface, self.border_color, self.rect, 3, border_radius=10)
-        text_surf = self.font.render(self.text, True, WHITE)
+        text_surf = TEXT_CACHE.render(self.font, self.text, WHITE)
         surface.blit(text_surf, text_surf.get_rect(center=self.rect.center))
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -177,6 +912,7 @@ class Camera:
         self.rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
         self.world_width, self.world_height = world_w, world_h
     def apply(self, target_rect): return target_rect.move(self.rect.topleft)
+    def view_rect(self): return pygame.Rect(-self.rect.x, -self.rect.y, SCREEN_WIDTH, SCREEN_HEIGHT)
     def update(self, target):
         x = -target.rect.centerx + int(SCREEN_WIDTH / 2)
         y = -target.rect.centery + int(SCREEN_HEIGHT / 2)
@@ -184,10 +920,10 @@ class Camera:
         y = min(0, max(-(self.world_height - SCREEN_HEIGHT), y))
         self.rect.topleft = (x, y)
 
-class Player(pygame.sprite.Sprite):
+class Player(Entity):
     def __init__(self, game):
         super().__init__(); self.game = game
-        self.image = pygame.Surface((50, 50)); self.image.fill(BLUE)
+        self.image = IMAGE_CACHE.get('player')
         self.rect = self.image.get_rect()
         self.pos = pygame.math.Vector2(WORLD_WIDTH / 2, WORLD_HEIGHT / 2)
     def reset(self):
@@ -196,7 +932,7 @@ class Player(pygame.sprite.Sprite):
         self.exp_gain_multiplier = 1 + (self.game.permanent_upgrades.get('EXP_GAIN', 0) * 0.05)
         self.gold_gain_multiplier = 1 + (self.game.permanent_upgrades.get('GOLD_GAIN', 0) * 0.1)
         self.pos.xy = WORLD_WIDTH / 2, WORLD_HEIGHT / 2
-        self.speed, self.max_hp = 5, self.base_max_hp
+        self.speed, self.max_hp, self.magnet_radius = 5, self.base_max_hp, GEM_MAGNET_RADIUS
         self.hp = self.max_hp
         self.level, self.exp, self.exp_to_next_level = 1, 0, LEVEL_DATA[0]
         self.invincible, self.invincible_duration, self.last_hit_time = False, 1000, 0
@@ -218,12 +954,8 @@ class Player(pygame.sprite.Sprite):
         self.exp_to_next_level = LEVEL_DATA[min(self.level - 1, len(LEVEL_DATA) - 1)]
         self.game.generate_upgrades(); self.game.game_state = 'LEVEL_UP'
     def find_closest_enemy(self):
-        closest_dist_sq, closest_enemy = float('inf'), None
-        if not self.game.enemies: return None
-        for enemy in self.game.enemies:
-            dist_sq = self.pos.distance_squared_to(enemy.pos)
-            if dist_sq < closest_dist_sq: closest_dist_sq, closest_enemy = dist_sq, enemy
-        return closest_enemy
+        closest = self.game.query_nearest_enemies(self.pos, 1)
+        return closest[0] if closest else None
     
     # [추가] 모든 체력 감소 및 사망 처리를 담당하는 내부 메소드
     def _apply_damage(self, amount):
@@ -240,25 +972,25 @@ class Player(pygame.sprite.Sprite):
         if not self.invincible:
             self._apply_damage(amount)
             if self.hp > 0:
-                 self.invincible, self.last_hit_time = True, pygame.time.get_ticks()
+                 self.invincible, self.last_hit_time = True, self.game.clock.now
 
     # [추가] 접촉 피해용 메소드 (무적 부여 안함)
     def take_contact_damage(self, amount):
         self._apply_damage(amount)
 
     def update(self):
-        if self.invincible and pygame.time.get_ticks() - self.last_hit_time > self.invincible_duration:
+        if self.invincible and self.game.clock.now - self.last_hit_time > self.invincible_duration:
             self.invincible = False
-        vel = pygame.math.Vector2(0, 0); keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]: vel.x = -1
-        if keys[pygame.K_RIGHT] or keys[pygame.K_d]: vel.x = 1
-        if keys[pygame.K_UP] or keys[pygame.K_w]: vel.y = -1
-        if keys[pygame.K_DOWN] or keys[pygame.K_s]: vel.y = 1
-        if vel.length() > 0: self.pos += vel.normalize() * self.speed
+        vel = self.read_input()
+        if vel.length() > 0: self.pos += vel.normalize() * (self.speed * self.game.move_scale)
         self.pos.x = max(0, min(self.pos.x, WORLD_WIDTH))
         self.pos.y = max(0, min(self.pos.y, WORLD_HEIGHT))
         self.rect.center = self.pos
         for skill in self.skills.values(): skill.update()
+    def read_input(self):
+        """ 이번 틱의 이동 방향. 입력 스크립트가 있으면 키보드 대신 스크립트를 따른다 """
+        if self.game.input_script: return pygame.math.Vector2(self.game.input_script(self.game.tick_count * self.game.move_scale))
+        return input_mask_vector(self.game.read_input_mask())
     def draw_hp_bar(self, surface, camera):
         if self.hp > 0:
             bar_w, bar_h = 50, 8
@@ -267,18 +999,28 @@ class Player(pygame.sprite.Sprite):
             pygame.draw.rect(surface, RED, hp_bar_screen)
             pygame.draw.rect(surface, GREEN, (hp_bar_screen.x, hp_bar_screen.y, bar_w * (self.hp / self.max_hp), bar_h))
 
-class Enemy(pygame.sprite.Sprite):
+class Enemy(Entity):
+    __slots__ = ('game', 'slot', 'lod_bucket', 'speed', 'max_hp', '_hp', 'exp_drop', 'contact_damage', 'skill_hit_cooldown',
+                 'last_skill_hit_time', 'gold_drop')
     def __init__(self, game):
         super().__init__(); self.game = game
-        self.image = pygame.Surface((40, 40)); self.image.fill(RED); self.rect = self.image.get_rect()
-        self.pos = pygame.math.Vector2(0, 0)
-        self.speed, self.max_hp, self.hp = random.randint(1, 2), 20, 20
+        self.image = IMAGE_CACHE.get('enemy'); self.rect = self.image.get_rect()
+        self.pos, self.slot, self.lod_bucket = pygame.math.Vector2(0, 0), None, 0
+        self.speed, self.max_hp, self.hp = random.randint(1, 2) * self.game.move_scale, 20, 20
         self.exp_drop, self.contact_damage, self.skill_hit_cooldown, self.last_skill_hit_time = 15, 5, 500, 0
         self.gold_drop = random.randint(1, 5)
+    # 벡터화 엔진 사용 중(slot이 있을 때)에는 체력의 원본이 EnemyHorde.hp 배열이다
+    @property
+    def hp(self): return self.game.horde.hp[self.slot] if self.slot is not None else self._hp
+    @hp.setter
+    def hp(self, value):
+        if self.slot is not None: self.game.horde.hp[self.slot] = value
+        else: self._hp = value
     def reset(self, pos):
         self.pos.xy = pos; self.rect.center = self.pos
         self.hp, self.last_skill_hit_time = self.max_hp, 0
-        self.game.all_sprites.add(self); self.game.enemies.add(self)
+        self.game.enemies.add(self)
+        if self.game.horde: self.game.horde.add(self)
     def take_damage(self, amount):
         self.hp -= amount
         if self.hp <= 0:
@@ -287,48 +1029,189 @@ class Enemy(pygame.sprite.Sprite):
             return self.rect.center
         return None
     def update(self):
-        attraction_vec = self.game.player.pos - self.pos
-        separation_vec, close_enemies_count, search_radius = pygame.math.Vector2(0, 0), 0, 40
-        search_rect = pygame.Rect(self.pos.x-search_radius, self.pos.y-search_radius, search_radius*2, search_radius*2)
-        for other in self.game.quadtree.retrieve([], search_rect):
-            if other is not self and self.pos.distance_squared_to(other.pos) < search_radius**2:
-                separation_vec += self.pos - other.pos; close_enemies_count += 1
+        game = self.game; attraction_vec = game.player.pos - self.pos
+        field = game.flow_field if game.flow_field.blocked else None  # 장애물이 없으면 필드 방향은 직선 방향과 같다
+        if game.lod_view and attraction_vec.length_squared() > LOD_DISTANCE ** 2 and not game.lod_view.collidepoint(self.pos):
+            # 먼 화면 밖 적: 자기 버킷 차례에만, 분리 없이 LOD_BUCKETS 틱치 보폭으로 움직인다
+            if (game.tick_count + self.lod_bucket) % LOD_BUCKETS == 0:
+                heading = field.direction(self.pos, attraction_vec) if field else attraction_vec.normalize()
+                self.pos += heading * (self.speed * LOD_BUCKETS); self.rect.center = self.pos
+            return
+        separation_vec, close_enemies_count, search_radius = pygame.math.Vector2(0, 0), 0, ENEMY_SEPARATION_RADIUS
+        for other in game.spatial_index.query_radius(self.pos, search_radius):
+            if other is not self: separation_vec += self.pos - other.pos; close_enemies_count += 1
         final_vec = pygame.math.Vector2(0, 0)
         if attraction_vec.length() > search_radius:
-            final_vec = attraction_vec.normalize()
+            final_vec = field.direction(self.pos, attraction_vec) if field else attraction_vec.normalize()
             if close_enemies_count > 0 and separation_vec.length() > 0:
                 final_vec = final_vec * 0.7 + separation_vec.normalize() * 0.3
         if final_vec.length() > 0: self.pos += final_vec.normalize() * self.speed
         self.rect.center = self.pos
 
-class ExpGem(pygame.sprite.Sprite):
+class ExpGem(Entity):
+    __slots__ = ('exp_value',)
     def __init__(self, pos, exp_value):
         super().__init__()
-        self.image = pygame.Surface((15, 15)); self.image.fill(YELLOW)
-        self.rect = self.image.get_rect(center=pos); self.exp_value = exp_value
+        self.pos = pygame.math.Vector2(pos); self.set_value(exp_value)
+    def set_value(self, exp_value):
+        self.exp_value = exp_value
+        self.image = IMAGE_CACHE.get('exp_gem_large' if exp_value >= LARGE_GEM_VALUE else 'exp_gem')
+        self.rect = self.image.get_rect(center=self.pos)
 
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, game, pos, target_enemy, source_skill):
+class Projectile(Entity):
+    __slots__ = ('game', 'vel', 'lifespan', 'damage', 'spawn_time')
+    def __init__(self, game):
         super().__init__(); self.game = game
-        self.image = pygame.Surface((10, 10)); self.image.fill(WHITE)
-        self.pos = pygame.math.Vector2(pos); self.rect = self.image.get_rect(center=self.pos)
-        self.damage = source_skill.damage
-        self.lifespan, self.spawn_time = 2000, pygame.time.get_ticks()
-        self.vel = (target_enemy.pos - self.pos).normalize() * source_skill.projectile_speed
-        self.game.all_sprites.add(self); self.game.projectiles.add(self)
+        self.image = IMAGE_CACHE.get('projectile')
+        self.pos, self.vel = pygame.math.Vector2(0, 0), pygame.math.Vector2(0, 0)
+        self.rect, self.lifespan = self.image.get_rect(), 2000
+    def reset(self, pos, target_enemy, source_skill):
+        self.pos.xy = pos; self.rect.center = self.pos
+        self.damage, self.spawn_time = source_skill.damage, self.game.clock.now
+        self.vel = (target_enemy.pos - self.pos).normalize() * (source_skill.projectile_speed * self.game.move_scale)
+        self.game.projectiles.add(self)
     def update(self):
         self.pos += self.vel; self.rect.center = self.pos
-        if pygame.time.get_ticks() - self.spawn_time > self.lifespan: self.kill()
+        if self.game.clock.now - self.spawn_time > self.lifespan: self.game.return_projectile_to_pool(self)
+
+# --- 세이브 파일 ---
+class SaveService:
+    """ 세이브 파일을 백그라운드 스레드에서 쓴다. 밀린 요청은 마지막 것 하나로 합치고,
+    임시 파일에 다 쓴 뒤 os.replace로 바꿔 끼워서 쓰는 도중에 꺼져도 이전 세이브가 남는다 """
+    def __init__(self, path):
+        self.path, self.pending, self.closed = path, None, False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='SaveService', daemon=True); self.thread.start()
+    def save(self, data):
+        """ data를 저장 대기열에 올리고 바로 반환한다. 아직 안 쓴 이전 요청은 버려진다 """
+        with self.cond: self.pending = data; self.cond.notify_all()
+    def close(self):
+        """ 밀린 저장을 마저 쓰고 스레드를 끝낸다 """
+        with self.cond: self.closed = True; self.cond.notify_all()
+        self.thread.join()
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None or self.closed)
+                if self.pending is None: return
+                self.cond.wait_for(lambda: self.closed, timeout=SAVE_COALESCE_DELAY)
+                data, self.pending = self.pending, None
+            try: self._write(data)
+            except OSError as e: print(f"세이브 파일을 쓰지 못했습니다: {e}", file=sys.stderr)
+    def _write(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f: json.dump(data, f, indent=4); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+# --- 게임 시계 ---
+TIME_SCALES = (0.25, 0.5, 1, 2, 4, 8)
+
+class GameClock:
+    """ 게임 로직이 읽는 유일한 시각 now(ms). PLAYING 틱마다 한 번만 고정 길이로 흘러서 일시정지/레벨업 동안은 멈춰 있다.
+    time_scale은 벽시계 1ms당 몇 ms어치 틱을 돌릴지다. 틱 길이는 그대로 두고 틱 수만 바꾸므로 결과가 배속과 무관하다 """
+    def __init__(self, time_scale=1):
+        # 0이면 창 모드 게임이 멈추고, 음수면 누적 시간과 보간 비율이 음수가 된다. F6/F7이 오가는 단계만 허용한다
+        if time_scale not in TIME_SCALES: raise ValueError(f"time_scale은 {TIME_SCALES} 중 하나여야 합니다: {time_scale}")
+        self.now, self.time_scale = 0, time_scale
+    def reset(self): self.now = 0
+    def tick(self, dt): self.now += dt
+    def scaled(self, frame_ms): return frame_ms * self.time_scale
+    def change_scale(self, direction):
+        """ TIME_SCALES에서 한 단계 느리게(-1)/빠르게(+1) """
+        i = bisect.bisect_left(TIME_SCALES, self.time_scale) + direction
+        self.time_scale = TIME_SCALES[max(0, min(len(TIME_SCALES) - 1, i))]
+
+# --- 입력 기록/재생 ---
+# 키보드 입력 비트마스크의 비트 순서: (키들, 이동 방향). 뒤 비트가 같은 축의 앞 비트를 덮어쓴다
+INPUT_BITS = (((pygame.K_LEFT, pygame.K_a), (-1, 0)), ((pygame.K_RIGHT, pygame.K_d), (1, 0)),
+              ((pygame.K_UP, pygame.K_w), (0, -1)), ((pygame.K_DOWN, pygame.K_s), (0, 1)))
+REPLAY_VERSION = 1
+
+def keyboard_input_mask():
+    keys = pygame.key.get_pressed()
+    return sum(1 << bit for bit, (codes, _) in enumerate(INPUT_BITS) if any(keys[code] for code in codes))
+
+def input_mask_vector(mask):
+    vel = pygame.math.Vector2(0, 0)
+    for bit, (_, (dx, dy)) in enumerate(INPUT_BITS):
+        if mask >> bit & 1:
+            if dx: vel.x = dx
+            if dy: vel.y = dy
+    return vel
+
+class InputRecorder:
+    """ 한 판의 시드/설정/영구 강화, 틱별 입력 비트마스크(런 길이 압축), 레벨업 선택을 모아 gzip JSON으로 저장한다 """
+    def __init__(self, path): self.path, self.active = path, False
+    def start(self, seed, config, permanent_upgrades):
+        self.active, self.ticks, self.runs, self.choices = True, 0, [], []
+        self.header = {'version': REPLAY_VERSION, 'seed': seed, 'config': config, 'permanent_upgrades': dict(permanent_upgrades)}
+    def log_input(self, tick, mask):
+        if not self.active: return
+        assert tick == self.ticks + 1, "입력은 틱마다 한 번씩 순서대로 기록해야 한다"
+        self.ticks = tick
+        if self.runs and self.runs[-1][0] == mask: self.runs[-1][1] += 1
+        else: self.runs.append([mask, 1])
+    def log_choice(self, tick, key):
+        if self.active: self.choices.append([tick, key])
+    def finish(self, final):
+        """ 기록을 파일로 쓰고 멈춘다. final은 재생 검증용 마지막 상태 요약 """
+        if not self.active: return
+        self.active = False
+        data = dict(self.header, inputs=self.runs, choices=self.choices, final=final)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f: json.dump(data, f, separators=(',', ':'))
+
+class InputReplay:
+    """ InputRecorder 파일을 읽어 같은 시드/설정으로 틱별 입력과 레벨업 선택을 그대로 돌려준다 """
+    def __init__(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f: data = json.load(f)
+        if data.get('version') != REPLAY_VERSION: raise ValueError(f"지원하지 않는 재생 파일 버전: {data.get('version')}")
+        self.seed, self.config, self.permanent_upgrades = data['seed'], data['config'], data['permanent_upgrades']
+        self.masks, self.ends, total = [], [], 0
+        for mask, count in data['inputs']: total += count; self.masks.append(mask); self.ends.append(total)
+        self.all_choices, self.final = [tuple(choice) for choice in data['choices']], data['final']
+        self.ticks = self.final['ticks']; self.rewind()
+    def rewind(self): self.choices = deque(self.all_choices)
+    def game_kwargs(self):
+        """ 기록 당시와 같은 시뮬레이션이 되도록 Game에 넘길 설정 """
+        kwargs = dict(self.config); name = kwargs.pop('input_script')
+        return dict(kwargs, input_script=INPUT_SCRIPTS[name] if name else None)
+    def input_mask(self, tick):
+        i = bisect.bisect_left(self.ends, tick)
+        return self.masks[i] if i < len(self.masks) else 0
+    def choice(self, tick):
+        recorded_tick, key = self.choices.popleft()
+        if recorded_tick != tick: raise RuntimeError(f"재생이 어긋났습니다: 레벨업이 기록은 {recorded_tick}틱, 재생은 {tick}틱")
+        return key
+    def done(self, tick): return tick >= self.ticks
 
 # --- 게임 메인 클래스 ---
 class Game:
-    def __init__(self):
-        pygame.init()
-        pygame.display.set_caption("Vampire Survivors Clone"); self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.clock = pygame.time.Clock(); self.is_running = True
-        font_path = resource_path("GmarketSansTTF/GmarketSansTTFMedium.ttf")
-        self.title_font = pygame.font.Font(font_path, 96); self.header_font = pygame.font.Font(font_path, 72)
-        self.ui_font = pygame.font.Font(font_path, 36); self.upgrade_font = pygame.font.Font(font_path, 28)
+    # 첫 프레임(시작 메뉴)에는 제목/UI 폰트만 필요하므로 나머지는 실제로 그릴 때 만들어진다
+    title_font = property(lambda self: FONT_CACHE.get(96)); header_font = property(lambda self: FONT_CACHE.get(72))
+    ui_font = property(lambda self: FONT_CACHE.get(36)); upgrade_font = property(lambda self: FONT_CACHE.get(28))
+    debug_font = property(lambda self: FONT_CACHE.get(16))
+    def __init__(self, headless=False, seed=None, input_script=None, spatial_index='hash', enemy_engine='python',
+                 max_enemies=MAX_ENEMIES_ON_SCREEN, profile_csv=None, lod=True, workers=None, sim_rate=FPS, render_fps=0,
+                 record_path=None, replay=None, time_scale=1):
+        if enemy_engine != 'python' and np is None: raise RuntimeError("numpy 적 엔진을 쓰려면 numpy를 설치해야 합니다")
+        # 헤드리스: 더미 비디오 드라이버, 고정 시드, 스크립트 입력(기본 제자리), 세이브 파일 미사용. 재생도 세이브 파일을 건드리지 않는다
+        self.headless, self.seed, self.persistent = headless, seed, not headless and replay is None
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            if input_script is None and replay is None: input_script = INPUT_SCRIPTS['idle']
+        self.recorder, self.replay = InputRecorder(record_path) if record_path else None, replay
+        self.save_service = SaveService(SAVE_FILE) if self.persistent else None
+        self.input_script, self.spatial_index_kind = input_script, spatial_index
+        self.enemy_engine, self.max_enemies, self.horde, self.workers = enemy_engine, max_enemies, None, workers
+        self.lod_enabled, self.lod_view = lod, None
+        self.profiler = FrameProfiler(csv_path=profile_csv)
+        self.clock, self.tick_count, self.dt = GameClock(time_scale), 0, 0
+        # 고정 틱: 시뮬레이션은 sim_rate Hz로, 그리기는 vsync(모니터 주사율)에 맞춰 돌고 남은 시간 비율만큼 보간해 그린다. render_fps는 추가 상한
+        self.sim_rate, self.sim_dt, self.move_scale, self.render_fps = sim_rate, 1000 / sim_rate, FPS / sim_rate, render_fps
+        self.accumulator, self.render_alpha, self.prev_rects, self.interpolate = 0, 1, {}, not headless
+        pygame.display.init(); pygame.font.init()  # 믹서/조이스틱 등 쓰지 않는 서브시스템은 켜지 않는다
+        pygame.display.set_caption("Vampire Survivors Clone"); self.screen = self.open_display()
+        self.frame_clock = pygame.time.Clock(); self.is_running = True; self.first_frame_ms = None
         self.game_state, self.current_upgrade_options, self.upgrade_option_rects = 'START_MENU', [], []
         self.load_game_data()
         btn_w, btn_h, btn_gap, btn_x = 250, 60, 20, SCREEN_WIDTH/2 - 125
@@ -346,31 +1229,146 @@ class Game:
         self.game_over_main_menu_button = Button(btn_x, SCREEN_HEIGHT/2 + btn_gap, btn_w, btn_h, '메인 메뉴', self.ui_font)
         
         self.shop_buttons = {}
+        self.state_buttons = {
+            'START_MENU': [self.start_button, self.shop_button, self.credits_button, self.quit_button],
+            'SHOP': [self.back_button], 'CREDITS': [self.back_button],
+            'PAUSED': [self.resume_button, self.main_menu_button, self.quit_from_pause_button],
+            'GAME_OVER': [self.restart_button, self.game_over_main_menu_button],
+        }
+        # 정적 화면(메뉴/상점/제작진/일시정지/레벨업/게임오버)의 합성 결과 캐시와 다시 그릴 영역
+        self.static_frame, self.static_frame_state, self.dirty_rects, self.overlays = None, None, [], {}
+        self.background = TiledBackground(WORLD_WIDTH, WORLD_HEIGHT)
 
+    def open_display(self):
+        """ 창 모드는 vsync로 연다 (pygame은 SCALED/OPENGL일 때만 vsync를 켠다).
+        하드웨어 렌더러를 못 만들면(오류, 또는 소프트웨어 렌더러로 바꿨다는 경고) vsync가 없으므로 FPS 상한으로 대신한다 """
+        if self.headless: return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        screen = reason = None
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            try: screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SCALED, vsync=1)
+            except pygame.error as e: reason = e
+        if reason is None and caught: reason = caught[0].message
+        if reason is None: return screen
+        print(f"vsync unavailable ({reason}), capping rendering at {self.render_fps or FPS} FPS")
+        if not self.render_fps: self.render_fps = FPS  # vsync 없이 상한까지 없으면 CPU를 다 쓰며 그린다
+        return screen or pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     def load_game_data(self):
-        try:
-            with open(SAVE_FILE, 'r') as f: data = json.load(f)
-            self.gold = data.get('gold', 0); self.permanent_upgrades = data.get('permanent_upgrades', {})
-        except (FileNotFoundError, json.JSONDecodeError): self.gold, self.permanent_upgrades = 0, {}
+        self.gold, self.permanent_upgrades = 0, {}
+        if self.persistent:
+            try:
+                with open(SAVE_FILE, 'r') as f: data = json.load(f)
+                self.gold = data.get('gold', 0); self.permanent_upgrades = data.get('permanent_upgrades', {})
+            except (FileNotFoundError, json.JSONDecodeError): pass
         for key in PERMANENT_UPGRADE_DATA: self.permanent_upgrades.setdefault(key, 0)
     def save_game_data(self):
-        with open(SAVE_FILE, 'w') as f: json.dump({'gold': self.gold, 'permanent_upgrades': self.permanent_upgrades}, f, indent=4)
+        """ 지금 골드/영구 강화의 사본을 SaveService에 넘긴다. 디스크 쓰기는 게임 루프를 막지 않는다 """
+        if self.save_service: self.save_service.save({'gold': self.gold, 'permanent_upgrades': dict(self.permanent_upgrades)})
     def gain_gold(self, amount): self.session_gold += int(amount * self.player.gold_gain_multiplier)
     def run(self):
-        while self.is_running: self.clock.tick(FPS); self.handle_events(); self.update(); self.draw()
-        pygame.quit()
+        # 루프에서 예외가 나도 close()가 밀린 세이브를 디스크에 쓰고 워커를 내리도록 finally로 감싼다
+        try:
+            if self.replay: self.new_game()
+            while self.is_running:
+                if self.is_idle():
+                    # 정적 화면에서 바뀐 것이 없으면 다음 이벤트가 올 때까지 잠든다
+                    self.handle_events([pygame.event.wait()] + pygame.event.get()); self.frame_clock.tick()
+                else: frame_ms = self.frame_clock.tick(self.render_fps); self.profiler.begin_frame(); self.handle_events(); self.advance(frame_ms)
+                self.draw()
+                if self.first_frame_ms is None:
+                    self.first_frame_ms = (time.perf_counter() - STARTUP_TIME) * 1000; print(f"time to first frame: {self.first_frame_ms:.0f} ms")
+                if self.game_state == 'PLAYING': self.profiler.end_frame(self.entity_counts())
+        finally: self.close()
+    def close(self):
+        """ 샤드 워커, 밀린 세이브, 프로파일러 기록을 정리하고 pygame을 내린다.
+        pygame 객체를 쥔 모듈 캐시도 비워서 같은 프로세스의 다음 Game이 죽은 폰트/서피스를 쓰지 않게 한다 """
+        self.finish_recording()
+        if self.horde: self.horde.close()
+        if self.save_service: self.save_service.close()
+        self.profiler.close(); TEXT_CACHE.clear(); FONT_CACHE.clear(); IMAGE_CACHE.clear(); pygame.quit()
+    def entity_counts(self):
+        return {'enemies': len(self.enemies), 'projectiles': len(self.projectiles), 'gems': len(self.exp_gems)}
+    def is_idle(self):
+        return (self.game_state != 'PLAYING' and self.replay is None and self.static_frame is not None
+                and self.static_frame_state == self.game_state and not self.dirty_rects)
+    def invalidate_static_frame(self): self.static_frame = None
+    def advance(self, frame_ms):
+        """ 벽시계로 흐른 frame_ms를 모아 sim_dt 길이의 틱으로 소비하고, 남은 비율을 render_alpha로 둔다 """
+        # 긴 멈춤 뒤 따라잡기가 또 프레임을 늦추는 악순환 방지 (배속 중에는 그만큼 더 따라잡는다)
+        self.accumulator = min(self.accumulator + self.clock.scaled(frame_ms), self.clock.scaled(MAX_FRAME_TIME))
+        steps = int(self.accumulator // self.sim_dt)
+        for i in range(steps):
+            if i == steps - 1: self.prev_rects = self.snapshot_rects() if self.interpolate and self.game_state == 'PLAYING' else {}
+            self.step(self.sim_dt)
+        self.accumulator -= steps * self.sim_dt; self.render_alpha = self.accumulator / self.sim_dt
+        if self.game_state != 'PLAYING': self.prev_rects = {}
+    def snapshot_rects(self):
+        """ 보간용: 움직이는 엔티티와 카메라의 마지막 틱 직전 rect 위치 """
+        return {obj: obj.rect.topleft for layer in (self.enemies, self.projectiles, self.skill_sprites, self.attracted_gems,
+                                                    (self.player, self.camera)) for obj in layer}
+    @contextlib.contextmanager
+    def interpolated_rects(self):
+        """ 그리는 동안만 엔티티와 카메라 rect를 직전 틱과 현재 틱 사이(render_alpha)로 옮겨 둔다 """
+        prev, alpha, current = self.prev_rects, self.render_alpha, []
+        for obj, (px, py) in prev.items():
+            x, y = obj.rect.topleft; current.append((obj, x, y))
+            obj.rect.topleft = (round(px + (x - px) * alpha), round(py + (y - py) * alpha))
+        try: yield
+        finally:
+            for obj, x, y in current: obj.rect.topleft = (x, y)
+    def step(self, dt):
+        """ 시뮬레이션을 dt(ms)만큼 한 틱 진행한다. 게임 시계와 틱 번호는 PLAYING일 때만 흐른다 """
+        if self.replay and self.game_state == 'LEVEL_UP': self.apply_upgrade(self.replay.choice(self.tick_count))
+        self.dt = dt
+        if self.game_state == 'PLAYING': self.clock.tick(dt); self.tick_count += 1
+        self.update()
+        if self.game_state == 'GAME_OVER': self.finish_recording()
+        if self.replay and self.replay.done(self.tick_count) and self.game_state in ('PLAYING', 'GAME_OVER'): self.is_running = False
+    def run_headless(self, ticks, dt=None):
+        """ 화면 출력과 FPS 제한 없이 최대 ticks 틱을 돌린다. (실행된 틱 수, 걸린 초)를 반환 """
+        if self.game_state != 'PLAYING': self.new_game()
+        done, start = 0, time.perf_counter()
+        while done < ticks and self.is_running and self.game_state != 'GAME_OVER':
+            if self.game_state == 'LEVEL_UP' and not self.replay: self.apply_upgrade(self.pick_rng.choice(self.current_upgrade_options))
+            self.profiler.begin_frame(); self.step(dt or self.sim_dt); self.profiler.end_frame(self.entity_counts()); done += 1
+        return done, time.perf_counter() - start
     def new_game(self):
-        self.all_sprites = pygame.sprite.Group(); self.enemies = pygame.sprite.Group()
-        self.projectiles = pygame.sprite.Group(); self.exp_gems = pygame.sprite.Group()
-        self.skill_sprites = pygame.sprite.Group()
-        self.enemy_pool = []; self.quadtree = Quadtree(0, (0, 0, WORLD_WIDTH, WORLD_HEIGHT))
-        self.spawn_timer, self.spawn_interval = 0, 500
+        self.enemies, self.projectiles, self.exp_gems, self.skill_sprites = EntityList(), EntityList(), EntityList(), EntityList()
+        self.enemy_pool, self.projectile_pool = [], []; self.spatial_index = SPATIAL_INDEX_FACTORIES[self.spatial_index_kind]()
+        self.nearest_cache, self.collision_grid = {}, CollisionGrid()
+        self.gem_index, self.attracted_gems = SpatialHash(64), []
+        self.flow_field = FlowField(WORLD_WIDTH, WORLD_HEIGHT)
+        # 다시 시작할 때 워커 프로세스를 새로 띄우지 않도록 엔진은 판을 넘어 유지한다
+        if self.horde: self.horde.reset()
+        else: self.horde = {'numpy': EnemyHorde, 'sharded': lambda: ShardedHorde(self.workers)}.get(self.enemy_engine, lambda: None)()
+        self.spawn_timer, self.spawn_interval, self.spawned_count = 0, 500, 0
         self.game_state, self.kill_count = 'PLAYING', 0; self.session_gold = 0
-        self.game_start_time, self.paused_time = pygame.time.get_ticks(), 0
+        self.clock.reset(); self.tick_count, self.accumulator, self.prev_rects = 0, 0, {}
+        # 판마다 시드를 정해 두어야 기록/재생이 같은 난수열을 쓴다
+        self.run_seed = self.replay.seed if self.replay else self.seed if self.seed is not None else random.randrange(2 ** 32)
+        random.seed(self.run_seed)
+        # 헤드리스 자동 레벨업 선택은 따로 뽑는다: 재생은 선택을 기록에서 읽으므로 게임 난수열에서 뽑으면 그 뒤로 어긋난다
+        self.pick_rng = random.Random(self.run_seed)
+        if self.replay: self.permanent_upgrades = dict(self.replay.permanent_upgrades); self.replay.rewind()
+        if self.recorder: self.recorder.start(self.run_seed, self.replay_config(), self.permanent_upgrades)
         if not hasattr(self, 'player'): self.player = Player(self)
-        self.player.reset(); self.all_sprites.add(self.player)
+        self.player.reset()
         self.camera = Camera(WORLD_WIDTH, WORLD_HEIGHT)
-        self.background_image = self.create_background(); self.background_rect = self.background_image.get_rect()
+    def replay_config(self):
+        script = next((name for name, fn in INPUT_SCRIPTS.items() if fn is self.input_script), None)
+        return {'sim_rate': self.sim_rate, 'enemy_engine': self.enemy_engine, 'spatial_index': self.spatial_index_kind,
+                'lod': self.lod_enabled, 'max_enemies': self.max_enemies, 'input_script': script}
+    def final_state(self):
+        """ 재생 검증용 요약. 같은 기록을 다시 돌리면 값이 비트 단위로 같아야 한다 """
+        return {'ticks': self.tick_count, 'kills': self.kill_count, 'level': self.player.level, 'hp': self.player.hp,
+                'pos': [self.player.pos.x, self.player.pos.y], 'enemies': len(self.enemies)}
+    def finish_recording(self):
+        if self.recorder and self.recorder.active: self.recorder.finish(self.final_state())
+    def read_input_mask(self):
+        """ 이번 틱의 키보드 입력 비트마스크. 재생 중이면 기록된 값을 쓰고, 기록 중이면 로그에 남긴다 """
+        mask = self.replay.input_mask(self.tick_count) if self.replay else keyboard_input_mask()
+        if self.recorder: self.recorder.log_input(self.tick_count, mask)
+        return mask
     def generate_upgrades(self):
         available = []
         acquired_skills = self.player.skills.keys()
@@ -379,8 +1377,8 @@ class Game:
             elif data['type'] == 'acquire' and data['skill_key'] not in acquired_skills: available.append(key)
             elif data['type'] == 'upgrade' and data['skill_key'] in acquired_skills: available.append(key)
         self.current_upgrade_options = random.sample(available, min(3, len(available)))
-        self.paused_time = pygame.time.get_ticks()
     def apply_upgrade(self, upgrade_key):
+        if self.recorder: self.recorder.log_choice(self.tick_count, upgrade_key)
         data = UPGRADE_DATA.get(upgrade_key, {})
         if data['type'] == 'passive':
             target, op, val = data['target'], data['operation'], data['value']
@@ -394,34 +1392,73 @@ class Game:
             key = data['skill_key']
             if key in self.player.skills: self.player.skills[key].level_up(upgrade_key)
         self.unpause_game()
-    def return_enemy_to_pool(self, enemy): enemy.kill(); self.enemy_pool.append(enemy)
+    def query_nearest_enemies(self, pos, k=1, max_radius=None):
+        """ 공간 인덱스로 pos에서 가장 가까운 적 최대 k개를 찾는다. 같은 틱 안의 같은 질의는 캐시를 공유한다 """
+        key = (pos.x, pos.y, k, max_radius)
+        if (cached := self.nearest_cache.get(key)) is None:
+            cached = self.nearest_cache[key] = self.spatial_index.nearest(pos, k, max_radius)
+        return cached
+    def return_enemy_to_pool(self, enemy):
+        if self.horde: self.horde.remove(enemy)
+        enemy.kill(); self.enemy_pool.append(enemy); self.prev_rects.pop(enemy, None)
+    def spawn_projectile(self, pos, target_enemy, source_skill):
+        projectile = self.projectile_pool.pop() if self.projectile_pool else Projectile(self)
+        projectile.reset(pos, target_enemy, source_skill); return projectile
+    def on_enemy_killed(self, enemy, pos): self.kill_count += 1; self.drop_exp_gem(pos, enemy.exp_drop)
+    def drop_exp_gem(self, pos, exp_value):
+        """ 근처(GEM_MERGE_RADIUS)에 젬이 있거나 젬 수가 상한이면 새로 만들지 않고 가까운 젬의 값을 키운다 """
+        pos = pygame.math.Vector2(pos)
+        target = self.gem_index.nearest(pos, 1, GEM_MERGE_RADIUS)
+        if not target and len(self.exp_gems) >= MAX_EXP_GEMS: target = self.gem_index.nearest(pos, 1)
+        if target: target[0].set_value(target[0].exp_value + exp_value); return
+        gem = ExpGem(pos, exp_value); self.exp_gems.add(gem); self.gem_index.insert(gem)
+    def collect_exp_gems(self):
+        """ 자석 반경 안의 젬을 인덱스에서 빼 플레이어 쪽으로 끌어오고, 충분히 가까워지면 줍는다 """
+        player = self.player
+        for gem in self.gem_index.query_radius(player.pos, player.magnet_radius):
+            self.gem_index.remove(gem); self.attracted_gems.append(gem)
+        still_flying = []
+        for gem in self.attracted_gems:
+            to_player = player.pos - gem.pos
+            if to_player.length_squared() <= GEM_PICKUP_RADIUS ** 2:
+                gem.kill(); player.gain_exp(gem.exp_value); continue
+            gem.pos += to_player.normalize() * min(GEM_MAGNET_SPEED * self.move_scale, to_player.length()); gem.rect.center = gem.pos
+            still_flying.append(gem)
+        self.attracted_gems = still_flying
+    def return_projectile_to_pool(self, projectile):
+        projectile.kill(); self.projectile_pool.append(projectile); self.prev_rects.pop(projectile, None)
     def manage_enemy_spawning(self):
-        self.spawn_timer += self.clock.get_time()
+        self.spawn_timer += self.dt
         if self.spawn_timer > self.spawn_interval:
             self.spawn_timer = 0
-            if len(self.enemies) < MAX_ENEMIES_ON_SCREEN:
+            if len(self.enemies) < self.max_enemies:
                 angle, dist = random.uniform(0, 2*math.pi), random.uniform(700, 800)
                 pos = (max(0,min(self.player.pos.x+math.cos(angle)*dist, WORLD_WIDTH)),
                        max(0,min(self.player.pos.y+math.sin(angle)*dist, WORLD_HEIGHT)))
-                enemy = self.enemy_pool.pop() if self.enemy_pool else Enemy(self); enemy.reset(pos)
-    def create_background(self):
-        bg = pygame.Surface((WORLD_WIDTH, WORLD_HEIGHT)); bg.fill(DARK_GREY); ts = 100
-        for x in range(0, WORLD_WIDTH, ts): pygame.draw.line(bg, LIGHT_GREY, (x, 0), (x, WORLD_HEIGHT))
-        for y in range(0, WORLD_HEIGHT, ts): pygame.draw.line(bg, LIGHT_GREY, (0, y), (WORLD_WIDTH, y))
-        return bg
-    def unpause_game(self):
-        pause_duration = pygame.time.get_ticks() - self.paused_time
-        self.game_start_time += pause_duration
-        self.game_state = 'PLAYING'
+                self.spawn_enemy(pos)
+    def spawn_enemy(self, pos):
+        enemy = self.enemy_pool.pop() if self.enemy_pool else Enemy(self)
+        enemy.lod_bucket = self.spawned_count % LOD_BUCKETS; self.spawned_count += 1  # 먼 적 갱신을 틱마다 고르게 나눈다
+        enemy.reset(pos); return enemy
+    def unpause_game(self): self.game_state = 'PLAYING'
     def return_to_main_menu(self):
-        self.all_sprites, self.enemies, self.projectiles, self.exp_gems, self.skill_sprites, self.enemy_pool, self.quadtree = (None,)*7
+        self.finish_recording()
+        if self.horde: self.horde.close()
+        self.enemies, self.projectiles, self.exp_gems, self.skill_sprites, self.enemy_pool, self.spatial_index, self.horde = (None,)*7
+        self.projectile_pool, self.gem_index, self.attracted_gems = None, None, None
         self.game_state = 'START_MENU'
-    def handle_events(self):
-        for event in pygame.event.get():
+    def handle_events(self, events=None):
+        for event in pygame.event.get() if events is None else events:
             if event.type == pygame.QUIT: self.is_running = False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3: self.profiler.toggle_overlay()
+            if event.type == pygame.KEYDOWN and event.key in (pygame.K_F6, pygame.K_F7): self.clock.change_scale(1 if event.key == pygame.K_F7 else -1)
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED): self.invalidate_static_frame()
+            if event.type == pygame.MOUSEMOTION:
+                for button in self.state_buttons.get(self.game_state, []):
+                    if button.update_hover(event.pos): self.dirty_rects.append(button.rect)
             if self.game_state == 'PLAYING':
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                    self.game_state = 'PAUSED'; self.paused_time = pygame.time.get_ticks()
+                    self.game_state = 'PAUSED'
             elif self.game_state == 'START_MENU':
                 if self.start_button.handle_event(event): self.new_game()
                 elif self.shop_button.handle_event(event): self.game_state = 'SHOP'
@@ -449,78 +1486,108 @@ class Game:
         data, level = PERMANENT_UPGRADE_DATA[key], self.permanent_upgrades.get(key, 0)
         if level < data['max_level']:
             cost = int(data['base_cost'] * (data['cost_increase_factor'] ** level))
-            if self.gold >= cost: self.gold -= cost; self.permanent_upgrades[key] += 1; self.save_game_data()
+            if self.gold >= cost:
+                self.gold -= cost; self.permanent_upgrades[key] += 1; self.save_game_data(); self.invalidate_static_frame()
     def update(self):
         if self.game_state == 'PLAYING':
-            self.quadtree.clear()
-            for enemy in self.enemies: self.quadtree.insert(enemy)
-            self.all_sprites.update(); self.camera.update(self.player); self.manage_enemy_spawning()
-            
-            # 투사체와 적 충돌 처리
-            hits = pygame.sprite.groupcollide(self.enemies, self.projectiles, False, True)
-            for enemy, projs in hits.items():
-                for proj in projs:
-                    if gem_pos := enemy.take_damage(proj.damage):
-                        self.kill_count += 1; gem = ExpGem(gem_pos, enemy.exp_drop)
-                        self.all_sprites.add(gem); self.exp_gems.add(gem)
-            
-            # [수정] 새로운 접촉 피해 로직
-            colliding_enemies = pygame.sprite.spritecollide(self.player, self.enemies, False)
-            if colliding_enemies:
-                if not self.player.is_in_contact_with_enemy: # 첫 충돌
-                    self.player.is_in_contact_with_enemy = True
-                    damage = 5 + len(colliding_enemies) # 기본 피해 + 닿은 적 수
+            profiler = self.profiler
+            if self.lod_enabled: self.lod_view = self.camera.view_rect().inflate(LOD_VIEW_MARGIN * 2, LOD_VIEW_MARGIN * 2)
+            with profiler.phase('flow_field'): self.flow_field.update(self.player.pos)
+            # 종류별 밀집 리스트를 차례로 갱신한다. 투사체를 먼저 돌려 이번 틱에 새로 쏜 것은 다음 틱부터 움직인다
+            with profiler.phase('sprite_update'):
+                self.projectiles.update(); self.player.update()  # 궤도 위 책은 Player.update 안에서 스킬이 한꺼번에 옮긴다
+                if not self.horde: self.enemies.update()  # 벡터화 엔진은 아래 EnemyHorde.step에서 한꺼번에 이동시킨다
+            if self.horde:
+                with profiler.phase('steering'): self.horde.step(self.player.pos, self.tick_count, self.lod_view,
+                                                                       self.flow_field if self.flow_field.blocked else None)
+            self.camera.update(self.player)
+            with profiler.phase('spawning'): self.manage_enemy_spawning()
+
+            # 충돌 대상을 한 격자에 모은 뒤 레이어 쌍별로 검사한다. 앞 단계에서 죽은 적은 alive()로 거른다
+            with profiler.phase('broadphase'):
+                self.collision_grid.rebuild({'player': (self.player,), 'enemy': self.enemies, 'projectile': self.projectiles})
+            with profiler.phase('collide_projectile'): self.resolve_projectile_hits()
+            with profiler.phase('collide_contact'): self.resolve_contact_damage()
+            with profiler.phase('gem_pickup'): self.collect_exp_gems()
+            with profiler.phase('collide_skill'): self.resolve_skill_hits()
+
+            # 틱 끝에 인덱스를 다시 만든다: 다음 틱의 조향/조준과 이번 프레임의 화면 컬링이 같은 최신 상태를 본다
+            with profiler.phase('index_build'): self.spatial_index.rebuild(self.enemies); self.nearest_cache = {}
+    def resolve_projectile_hits(self):
+        # 투사체 하나는 아직 살아있는 적 하나에게만 맞는다
+        for proj, enemies in self.collision_grid.pairs('projectile', 'enemy').items():
+            enemy = next((e for e in enemies if e.alive()), None)
+            if enemy is None: continue
+            self.return_projectile_to_pool(proj)
+            if gem_pos := enemy.take_damage(proj.damage): self.on_enemy_killed(enemy, gem_pos)
+    def resolve_contact_damage(self):
+        # [수정] 새로운 접촉 피해 로직
+        colliding_enemies = [e for e in self.collision_grid.collide(self.player.rect, 'enemy') if e.alive()]
+        if colliding_enemies:
+            if not self.player.is_in_contact_with_enemy: # 첫 충돌
+                self.player.is_in_contact_with_enemy = True
+                damage = 5 + len(colliding_enemies) # 기본 피해 + 닿은 적 수
+                self.player.take_contact_damage(damage)
+                self.player.last_contact_damage_time = self.clock.now
+            else: # 지속 충돌
+                now = self.clock.now
+                if now - self.player.last_contact_damage_time > self.player.contact_damage_cooldown:
+                    damage = 5 + len(colliding_enemies)
                     self.player.take_contact_damage(damage)
-                    self.player.last_contact_damage_time = pygame.time.get_ticks()
-                else: # 지속 충돌
-                    now = pygame.time.get_ticks()
-                    if now - self.player.last_contact_damage_time > self.player.contact_damage_cooldown:
-                        damage = 5 + len(colliding_enemies)
-                        self.player.take_contact_damage(damage)
-                        self.player.last_contact_damage_time = now
-            else:
-                self.player.is_in_contact_with_enemy = False
-
-            # 경험치 젬 획득
-            for gem in pygame.sprite.spritecollide(self.player, self.exp_gems, True): self.player.gain_exp(gem.exp_value)
-            
-            # 스킬과 적 충돌 처리
-            skill_hits = pygame.sprite.groupcollide(self.enemies, self.skill_sprites, False, False)
-            for enemy, skills in skill_hits.items():
-                now = pygame.time.get_ticks()
-                if now - enemy.last_skill_hit_time > enemy.skill_hit_cooldown:
+                    self.player.last_contact_damage_time = now
+        else:
+            self.player.is_in_contact_with_enemy = False
+    def resolve_skill_hits(self):
+        now = self.clock.now
+        for skill in self.player.skills.values():
+            for enemy in skill.hit_enemies():
+                if enemy.alive() and now - enemy.last_skill_hit_time > enemy.skill_hit_cooldown:
                     enemy.last_skill_hit_time = now
-                    if isinstance(skills[0], BibleSprite):
-                        if gem_pos := enemy.take_damage(skills[0].skill.damage):
-                            self.kill_count += 1; gem = ExpGem(gem_pos, enemy.exp_drop)
-                            self.all_sprites.add(gem); self.exp_gems.add(gem)
+                    if gem_pos := enemy.take_damage(skill.damage): self.on_enemy_killed(enemy, gem_pos)
     def draw(self):
-        if self.game_state == 'START_MENU': self.draw_start_menu()
-        elif self.game_state == 'SHOP': self.draw_shop_screen()
-        elif self.game_state == 'CREDITS': self.draw_credits_screen()
-        elif self.game_state in ['PLAYING', 'LEVEL_UP', 'GAME_OVER', 'PAUSED']:
-            if self.all_sprites: self.draw_game_screen()
+        if self.game_state == 'PLAYING' and self.enemies is not None:
+            self.draw_game_screen(); pygame.display.flip(); self.static_frame = None
+        else: self.draw_static_screen()
+    def draw_static_screen(self):
+        """ 정적 화면은 버튼을 뺀 바탕을 한 번 합성해 캐시하고, 이후에는 hover가 바뀐 버튼 영역만 다시 그린다 """
+        buttons = self.state_buttons.get(self.game_state, [])
+        if self.static_frame is None or self.static_frame_state != self.game_state:
+            if self.game_state == 'START_MENU': self.draw_start_menu()
+            elif self.game_state == 'SHOP': self.draw_shop_screen()
+            elif self.game_state == 'CREDITS': self.draw_credits_screen()
+            elif self.enemies is not None: self.draw_game_screen(); self.draw_overlay()
             else: self.draw_start_menu() # 게임 종료 후 리소스 정리됐을 때 대비
-        pygame.display.flip()
+            self.static_frame, self.static_frame_state = self.screen.copy(), self.game_state
+            mouse_pos = pygame.mouse.get_pos()
+            for button in buttons: button.update_hover(mouse_pos); button.draw(self.screen)
+            pygame.display.flip()
+        elif self.dirty_rects:
+            for button in buttons:
+                if button.rect in self.dirty_rects:
+                    self.screen.blit(self.static_frame, button.rect, button.rect); button.draw(self.screen)
+            pygame.display.update(self.dirty_rects)
+        self.dirty_rects = []
+    def get_overlay(self, alpha):
+        if (overlay := self.overlays.get(alpha)) is None:
+            overlay = self.overlays[alpha] = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA); overlay.fill((0,0,0,alpha))
+        return overlay
     def draw_start_menu(self):
         self.screen.fill(DARK_GREY)
-        title = self.title_font.render("Vampire Survivals", True, WHITE)
+        title = TEXT_CACHE.render(self.title_font, "Vampire Survivals", WHITE)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH/2, 150)))
-        self.start_button.draw(self.screen); self.shop_button.draw(self.screen)
-        self.credits_button.draw(self.screen); self.quit_button.draw(self.screen)
-        gold = self.ui_font.render(f"소유 골드: {self.gold} G", True, YELLOW)
+        gold = TEXT_CACHE.render(self.ui_font, f"소유 골드: {self.gold} G", YELLOW)
         self.screen.blit(gold, gold.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT - 50)))
     def draw_shop_screen(self):
-        self.screen.fill(DARK_GREY); title = self.header_font.render("상점", True, WHITE)
+        self.screen.fill(DARK_GREY); title = TEXT_CACHE.render(self.header_font, "상점", WHITE)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH/2, 80)))
-        gold = self.ui_font.render(f"소유 골드: {self.gold} G", True, YELLOW)
+        gold = TEXT_CACHE.render(self.ui_font, f"소유 골드: {self.gold} G", YELLOW)
         self.screen.blit(gold, gold.get_rect(center=(SCREEN_WIDTH/2, 140)))
         item_w, item_h, item_gap, y = 800, 80, 20, 200
         for i, (key, data) in enumerate(PERMANENT_UPGRADE_DATA.items()):
             rect = pygame.Rect(SCREEN_WIDTH/2-item_w/2, y+i*(item_h+item_gap), item_w, item_h)
             pygame.draw.rect(self.screen, UI_BG_COLOR, rect, border_radius=10)
             level = self.permanent_upgrades.get(key, 0)
-            name = self.ui_font.render(f"{data['name']} (Lv.{level}/{data['max_level']})", True, WHITE)
+            name = TEXT_CACHE.render(self.ui_font, f"{data['name']} (Lv.{level}/{data['max_level']})", WHITE)
             self.screen.blit(name, (rect.x + 20, rect.y + 10))
             cost = int(data['base_cost'] * (data['cost_increase_factor'] ** level))
             cost_text = "MAX" if level >= data['max_level'] else f"{cost} G"
@@ -528,37 +1595,45 @@ class Game:
             self.shop_buttons[key] = (btn_rect, cost_text)
             btn_color = UI_OPTION_BG_COLOR if self.gold >= cost and level < data['max_level'] else DARK_GREY
             pygame.draw.rect(self.screen, btn_color, btn_rect, border_radius=10)
-            cost_surf = self.ui_font.render(cost_text, True, YELLOW if self.gold >= cost else WHITE)
+            cost_surf = TEXT_CACHE.render(self.ui_font, cost_text, YELLOW if self.gold >= cost else WHITE)
             self.screen.blit(cost_surf, cost_surf.get_rect(center=btn_rect.center))
-        self.back_button.draw(self.screen)
     def draw_credits_screen(self):
-        self.screen.fill(DARK_GREY); title = self.header_font.render("제작진", True, WHITE)
+        self.screen.fill(DARK_GREY); title = TEXT_CACHE.render(self.header_font, "제작진", WHITE)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH/2, 150)))
-        creator = self.ui_font.render("Created by MHA", True, WHITE)
+        creator = TEXT_CACHE.render(self.ui_font, "Created by MHA", WHITE)
         self.screen.blit(creator, creator.get_rect(center=(SCREEN_WIDTH/2, 350)))
-        self.back_button.draw(self.screen)
     def draw_game_screen(self):
-        self.screen.fill(DARK_GREY)
-        self.screen.blit(self.background_image, self.camera.apply(self.background_rect))
-        for sprite in self.all_sprites: self.screen.blit(sprite.image, self.camera.apply(sprite.rect))
-        self.player.draw_hp_bar(self.screen, self.camera); self.draw_game_ui()
+        profiler = self.profiler
+        with self.interpolated_rects():
+            with profiler.phase('background'): self.screen.fill(DARK_GREY); self.background.draw(self.screen, self.camera)
+            with profiler.phase('sprite_blit'): self.draw_sprites()
+            with profiler.phase('hud'): self.player.draw_hp_bar(self.screen, self.camera); self.draw_game_ui()
+        if profiler.overlay_visible: profiler.draw_overlay(self.screen, self.debug_font)
+    def draw_sprites(self):
+        # 카메라에 보이는 엔티티만 골라 레이어 순서(젬 -> 적 -> 투사체 -> 스킬 -> 플레이어)대로 한 번에 blit
+        ox, oy = self.camera.rect.topleft; view = self.camera.view_rect()
+        layers = (self.gem_index.query_rect(view), self.attracted_gems, self.spatial_index.query_rect(view),
+                  self.projectiles, self.skill_sprites, (self.player,))
+        self.screen.blits([(s.image, (s.rect.x + ox, s.rect.y + oy)) for layer in layers for s in layer if view.colliderect(s.rect)],
+                          doreturn=False)
     def draw_game_ui(self):
         bar_w, bar_h = SCREEN_WIDTH - 40, 20
         exp_ratio = self.player.exp / self.player.exp_to_next_level if self.player.exp_to_next_level > 0 else 1
         pygame.draw.rect(self.screen, UI_BG_COLOR, (20, 20, bar_w, bar_h))
         pygame.draw.rect(self.screen, YELLOW, (20, 20, bar_w * exp_ratio, bar_h))
         pygame.draw.rect(self.screen, UI_BORDER_COLOR, (20, 20, bar_w, bar_h), 3)
-        self.screen.blit(self.ui_font.render(f"LV {self.player.level}", True, WHITE), (30, 45))
-        elapsed_ticks = (self.paused_time if self.game_state not in ['PLAYING'] else pygame.time.get_ticks()) - self.game_start_time
-        mins, secs = divmod(elapsed_ticks // 1000, 60)
-        timer = self.ui_font.render(f"{mins:02}:{secs:02}", True, WHITE)
+        self.screen.blit(TEXT_CACHE.render(self.ui_font, f"LV {self.player.level}", WHITE), (30, 45))
+        mins, secs = divmod(int(self.clock.now // 1000), 60)
+        scale = f"  x{self.clock.time_scale:g}" if self.clock.time_scale != 1 else ""
+        timer = TEXT_CACHE.render(self.ui_font, f"{mins:02}:{secs:02}{scale}", WHITE)
         self.screen.blit(timer, timer.get_rect(center=(SCREEN_WIDTH / 2, 60)))
         kill_text = f"처치: {self.kill_count} | 골드: {self.session_gold} G"
-        kills = self.ui_font.render(kill_text, True, WHITE)
+        kills = TEXT_CACHE.render(self.ui_font, kill_text, WHITE)
         self.screen.blit(kills, kills.get_rect(topright=(SCREEN_WIDTH - 30, 45)))
+    def draw_overlay(self):
+        """ 일시정지/레벨업/게임오버 때 게임 화면 위에 덮는 반투명 막과 제목 (버튼은 draw_static_screen이 그린다) """
         if self.game_state == 'LEVEL_UP':
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA); overlay.fill((0,0,0,180))
-            self.screen.blit(overlay, (0, 0)); title = self.header_font.render("LEVEL UP!", True, YELLOW)
+            self.screen.blit(self.get_overlay(180), (0, 0)); title = TEXT_CACHE.render(self.header_font, "LEVEL UP!", YELLOW)
             self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/5)))
             self.upgrade_option_rects.clear(); opt_w, opt_h = 500, 100
             start_y = SCREEN_HEIGHT/2 - (opt_h*1.5 + 20)
@@ -567,22 +1642,53 @@ class Game:
                 self.upgrade_option_rects.append(rect)
                 pygame.draw.rect(self.screen, UI_OPTION_BG_COLOR, rect, border_radius=10)
                 pygame.draw.rect(self.screen, UI_BORDER_COLOR, rect, 3, border_radius=10)
-                name = self.ui_font.render(data['name'], True, WHITE)
+                name = TEXT_CACHE.render(self.ui_font, data['name'], WHITE)
                 self.screen.blit(name, name.get_rect(center=rect.center))
         elif self.game_state == 'GAME_OVER':
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA); overlay.fill((0,0,0,200))
-            self.screen.blit(overlay, (0, 0)); title = self.header_font.render("GAME OVER", True, RED)
+            self.screen.blit(self.get_overlay(200), (0, 0)); title = TEXT_CACHE.render(self.header_font, "GAME OVER", RED)
             self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/3)))
-            self.restart_button.draw(self.screen)
-            self.game_over_main_menu_button.draw(self.screen)
         elif self.game_state == 'PAUSED':
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA); overlay.fill((0,0,0,180))
-            self.screen.blit(overlay, (0, 0)); title = self.header_font.render("PAUSED", True, WHITE)
+            self.screen.blit(self.get_overlay(180), (0, 0)); title = TEXT_CACHE.render(self.header_font, "PAUSED", WHITE)
             self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH/2, 150)))
-            self.resume_button.draw(self.screen); self.main_menu_button.draw(self.screen)
-            self.quit_from_pause_button.draw(self.screen)
 
 if __name__ == '__main__':
-    game = Game()
-    game.run()
+    multiprocessing.freeze_support()  # PyInstaller onefile exe에서 sharded 워커가 게임을 다시 띄우지 않게 한다
+    parser = argparse.ArgumentParser(description="Vampire Survivors Clone")
+    parser.add_argument('--headless', action='store_true', help="창 없이 FPS 제한 없이 시뮬레이션만 실행")
+    parser.add_argument('--ticks', type=int, default=3600, help="헤드리스 실행 틱 수")
+    parser.add_argument('--seed', type=int, default=None, help="난수 시드")
+    parser.add_argument('--spatial-index', choices=sorted(SPATIAL_INDEX_FACTORIES), default='hash', help="적 이웃 탐색용 공간 인덱스")
+    parser.add_argument('--enemy-engine', choices=ENEMY_ENGINES, default='python', help="적 조향 엔진 (numpy: 벡터화, sharded: 워커 프로세스 분할)")
+    parser.add_argument('--workers', type=int, default=None, help="sharded 엔진 워커 프로세스 수 (기본: CPU 코어 수)")
+    parser.add_argument('--max-enemies', type=int, default=MAX_ENEMIES_ON_SCREEN, help="동시에 존재할 수 있는 적 수")
+    parser.add_argument('--no-lod', action='store_true', help="먼 적의 LOD 갱신을 끄고 모든 적을 매 틱 전부 계산")
+    parser.add_argument('--profile', action='store_true', help="단계별 프레임 프로파일 오버레이를 켠 채 시작 (F3으로 토글)")
+    parser.add_argument('--profile-csv', default=None, help="프레임별 단계 측정값을 기록할 CSV 경로")
+    parser.add_argument('--sim-rate', type=int, default=FPS, help="고정 시뮬레이션 틱 속도(Hz)")
+    parser.add_argument('--render-fps', type=int, default=0, help="그리기 프레임 상한 (기본 0: 상한 없이 vsync로 모니터 주사율에 맞춘다, 예: 144)")
+    parser.add_argument('--input', choices=sorted(INPUT_SCRIPTS), default=None, help="입력 스크립트 (헤드리스 기본값: idle)")
+    parser.add_argument('--time-scale', type=float, default=1, choices=TIME_SCALES, help="게임 속도 배율 (F6/F7로 조절, 0.25 느리게 ~ 8 빠르게)")
+    parser.add_argument('--pack-assets', action='store_true', help=f"폰트와 이미지를 {ASSET_BUNDLE_FILE} 번들로 묶고 종료")
+    parser.add_argument('--record', default=None, help="이번 판의 시드/입력/레벨업 선택을 기록할 파일 (gzip JSON)")
+    parser.add_argument('--replay', default=None, help="기록 파일을 그대로 다시 실행 (설정은 기록에서 가져온다)")
+    args = parser.parse_args()
+    if args.pack_assets: print(f"packed {pack_assets()}"); sys.exit()
+    if args.replay:
+        replay = InputReplay(args.replay)
+        game = Game(headless=args.headless, profile_csv=args.profile_csv, workers=args.workers, render_fps=args.render_fps,
+                    time_scale=args.time_scale, replay=replay, **replay.game_kwargs())
+    else:
+        script = INPUT_SCRIPTS[args.input] if args.input else None
+        game = Game(headless=args.headless, seed=args.seed, input_script=script, spatial_index=args.spatial_index,
+                    enemy_engine=args.enemy_engine, max_enemies=args.max_enemies,
+                    profile_csv=args.profile_csv, lod=not args.no_lod, workers=args.workers,
+                    sim_rate=args.sim_rate, render_fps=args.render_fps, record_path=args.record, time_scale=args.time_scale)
+    if args.profile: game.profiler.toggle_overlay()
+    if args.headless:
+        ticks, elapsed = game.run_headless(math.inf if args.replay else args.ticks)
+        print(f"{ticks} ticks in {elapsed:.3f}s = {ticks / max(elapsed, 1e-9):.1f} ticks/s "
+              f"(enemies: {len(game.enemies)}, state: {game.game_state})")
+        game.close()
+    else: game.run()
+    if args.replay: print("replay matched" if game.final_state() == replay.final else f"replay diverged: {game.final_state()} != {replay.final}")
 
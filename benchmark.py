@@ -0,0 +1,135 @@
+# Vampire Survivals 시뮬레이션 벤치마크
+# 재현 가능한 상태로 Game을 만들고 화면 없이 고정 틱 수만큼 돌려 ms/tick과 최대 메모리를 잰다.
+#   python benchmark.py --output bench.json                      # 결과 저장
+#   python benchmark.py --baseline bench.json --threshold 0.1    # 기준 대비 10% 넘게 느려지면 종료 코드 1
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+import VampireSurvivals as vs
+
+BIG_HP = 10 ** 9  # 측정 중 게임 오버로 끝나지 않도록
+
+def spawn_ring(game, count, min_dist=300, max_dist=1500):
+    game.max_enemies = max(game.max_enemies, count)
+    for _ in range(count):
+        angle, dist = random.uniform(0, 2 * math.pi), random.uniform(min_dist, max_dist)
+        game.spawn_enemy((max(0, min(game.player.pos.x + math.cos(angle) * dist, vs.WORLD_WIDTH)),
+                          max(0, min(game.player.pos.y + math.sin(angle) * dist, vs.WORLD_HEIGHT))))
+
+def max_skills(game):
+    game.apply_upgrade('ACQUIRE_BIBLE')
+    for _ in range(7): game.apply_upgrade('BIBLE_COUNT')  # 책 8권
+    for key in ('BIBLE_DAMAGE', 'BIBLE_SPEED', 'MAGIC_BULLET_DAMAGE', 'MAGIC_BULLET_COOLDOWN', 'MAGIC_BULLET_SPEED'):
+        for _ in range(5): game.apply_upgrade(key)
+
+def scatter_gems(game, count):
+    # drop_exp_gem을 거치므로 합치기/상한이 적용된 실제 게임 상태가 만들어진다
+    for _ in range(count): game.drop_exp_gem((random.uniform(0, vs.WORLD_WIDTH), random.uniform(0, vs.WORLD_HEIGHT)), 15)
+
+def place_walls(game, count, length=320, thickness=64):
+    # 플로우 필드의 장애물 경로(다익스트라, 틱 분할 재계산)를 돌리기 위한 무작위 가로/세로 벽. 플레이어 주변은 비워 둔다
+    keep_clear = pygame.Rect(0, 0, 400, 400); keep_clear.center = game.player.pos
+    while count:
+        w, h = (length, thickness) if random.random() < 0.5 else (thickness, length)
+        wall = pygame.Rect(random.uniform(0, vs.WORLD_WIDTH - w), random.uniform(0, vs.WORLD_HEIGHT - h), w, h)
+        if not wall.colliderect(keep_clear): game.flow_field.add_obstacle(wall); count -= 1
+
+SCENARIOS = {
+    'enemies_150':  lambda game: spawn_ring(game, 150),
+    'enemies_1000': lambda game: spawn_ring(game, 1000),
+    'enemies_5000': lambda game: spawn_ring(game, 5000),
+    'skills_maxed': lambda game: (max_skills(game), spawn_ring(game, 500)),
+    'gems_10000':   lambda game: (scatter_gems(game, 10000), spawn_ring(game, 150)),
+    'obstacles_1000': lambda game: (place_walls(game, 40), spawn_ring(game, 1000)),
+}
+
+def build_game(name, seed, engine):
+    game = vs.Game(headless=True, seed=seed, input_script=vs.INPUT_SCRIPTS['circle'], enemy_engine=engine)
+    game.new_game(); game.player.max_hp = game.player.hp = BIG_HP
+    SCENARIOS[name](game)
+    game.spatial_index.rebuild(game.enemies)
+    return game
+
+def run_ticks(game, ticks):
+    times = []
+    for _ in range(ticks):
+        if game.game_state == 'LEVEL_UP': game.apply_upgrade(random.choice(game.current_upgrade_options))
+        start = time.perf_counter(); game.step(game.sim_dt); times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def run_scenario(name, ticks, seed, engine, measure_memory):
+    game = build_game(name, seed, engine)
+    run_ticks(game, min(30, ticks))  # 워밍업
+    times = sorted(run_ticks(game, ticks))
+    result = {
+        'ticks': ticks,
+        'ms_per_tick': sum(times) / len(times),
+        'p50_ms': times[len(times) // 2],
+        'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))],
+        'entities': game.entity_counts(),
+    }
+    if measure_memory:
+        # 시간 측정과 분리해, 같은 시드로 상태 구성부터 다시 돌리며 파이썬 힙 최대치를 잰다
+        tracemalloc.start()
+        mem_game = build_game(name, seed, engine); run_ticks(mem_game, ticks)
+        result['peak_mem_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop(); mem_game.close()
+    game.close()
+    return result
+
+def compare(results, baseline, threshold):
+    """ 기준 결과 대비 ms_per_tick/peak_mem_mb가 threshold 비율 넘게 늘어난 항목 목록 """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base: continue
+        for metric in ('ms_per_tick', 'peak_mem_mb'):
+            if metric in result and base.get(metric):
+                change = result[metric] / base[metric] - 1
+                print(f"  {name:<14}{metric:<13}{base[metric]:>10.3f} -> {result[metric]:>10.3f} ({change:+.1%})")
+                if change > threshold: regressions.append((name, metric, change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vampire Survivals 시뮬레이션 벤치마크")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="실행할 시나리오 (반복 가능, 기본: 전부)")
+    parser.add_argument('--ticks', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--engine', choices=vs.ENEMY_ENGINES, default='python')
+    parser.add_argument('--no-memory', action='store_true', help="메모리 측정(두 번째 실행) 생략")
+    parser.add_argument('--output', help="결과 JSON 저장 경로")
+    parser.add_argument('--baseline', help="비교할 기준 결과 JSON")
+    parser.add_argument('--threshold', type=float, default=0.10, help="회귀로 볼 증가 비율")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, args.ticks, args.seed, args.engine, not args.no_memory)
+        r = results[name]
+        print(f"{name:<14}{r['ms_per_tick']:>8.3f} ms/tick  p95 {r['p95_ms']:>7.3f} ms"
+              + (f"  peak {r['peak_mem_mb']:>7.2f} MB" if 'peak_mem_mb' in r else '') + f"  {r['entities']}")
+    report = {
+        'meta': {'ticks': args.ticks, 'seed': args.seed, 'engine': args.engine, 'python': platform.python_version(),
+                 'pygame': pygame.version.ver, 'numpy': vs.np.__version__ if vs.np else None, 'machine': platform.machine()},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f: json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, change in regressions: print(f"REGRESSION {name} {metric} {change:+.1%}")
+        if regressions: return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())